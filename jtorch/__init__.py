@@ -1,3 +1,5 @@
+from .allocator import *  # noqa: F401,F403
+from .generator import *  # noqa: F401,F403
 from .tensor import *  # noqa: F401,F403
 from .scalar import *  # noqa: F401,F403
 from .module import *  # noqa: F401,F403
@@ -8,9 +10,20 @@ from .autodiff import *  # noqa: F401,F403
 from .functions import *  # noqa: F401,F403
 from .cuda_functions import *  # noqa: F401,F403
 from .tensor_ops import *  # noqa: F401,F403
+from .numpy_ops import *  # noqa: F401,F403
 from .fast_ops import *  # noqa: F401,F403
+from .fusion import *  # noqa: F401,F403
 from .cuda_ops import *  # noqa: F401,F403
 from .nn import *  # noqa: F401,F403
-from . import fast_ops, cuda_ops, functions, cuda_functions  # noqa: F401,F403
+from .checkpoint import *  # noqa: F401,F403
+from . import (  # noqa: F401
+    fast_ops,
+    fusion,
+    numpy_ops,
+    cuda_ops,
+    functions,
+    cuda_functions,
+)
+from . import mask, streaming  # noqa: F401
 
 version = "0.1"
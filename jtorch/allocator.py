@@ -0,0 +1,161 @@
+"""
+Caching storage allocator.
+
+A training step allocates the same set of buffers (forward outputs,
+gradients, `expand` buffers) as the previous one, right after the previous
+ones were dropped. :class:`CachingAllocator` keeps freed buffers in pools by
+size class and hands them out again instead of going back to the system.
+
+A buffer is returned to its pool when the last array using it is garbage
+collected. Arrays are built on a small holder object (through
+`__array_interface__`), so every view of an allocation, however derived,
+keeps the holder alive and the buffer is never reused while visible.
+"""
+
+import weakref
+import numpy as np
+
+# Alignment of every buffer, in bytes: one cache line, enough for AVX-512.
+ALIGNMENT = 64
+
+# Smaller buffers are not pooled, the system allocator is as fast as the
+# bookkeeping for them.
+MIN_POOLED_BYTES = 4096
+
+
+def size_class(nbytes):
+    """
+    Pool a request of `nbytes` is served from.
+
+    Classes are spaced a quarter of a power of two apart (4096, 5120, 6144,
+    7168, 8192, 10240, ...), so at most 25% of a buffer is unused.
+
+    Returns:
+        int : size of the buffers of the class, in bytes.
+    """
+    step = max(1 << (max(nbytes - 1, 1).bit_length() - 3), ALIGNMENT)
+    return -(-nbytes // step) * step
+
+
+def _aligned(nbytes):
+    raw = np.empty(nbytes + ALIGNMENT, np.uint8)
+    offset = -raw.ctypes.data % ALIGNMENT
+    return raw[offset : offset + nbytes]
+
+
+class _Holder:
+    "Owner of a pooled block, exposed to NumPy as an array."
+
+    def __init__(self, block, size, dtype):
+        self.block = block
+        self.__array_interface__ = {
+            "data": (block.ctypes.data, False),
+            "shape": (size,),
+            "typestr": dtype.str,
+            "version": 3,
+        }
+
+
+class CachingAllocator:
+    """
+    Allocator for tensor storage that reuses freed buffers.
+
+    Args:
+        limit (int): most bytes kept in the pools. A freed buffer that would
+            go over it is released to the system instead.
+
+    Attributes:
+        hits (int): allocations served from a pool.
+        misses (int): allocations that needed a new buffer.
+        bytes_cached (int): bytes of free buffers in the pools.
+        bytes_in_use (int): bytes of pooled buffers currently handed out.
+        peak (int): highest `bytes_in_use` seen.
+    """
+
+    def __init__(self, limit=1 << 30):
+        self.limit = limit
+        self._pools = {}
+        self.reset_stats()
+        self.bytes_cached = 0
+        self.bytes_in_use = 0
+
+    def empty(self, size, dtype=np.float64):
+        """
+        Uninitialized 1-D storage.
+
+        Args:
+            size (int): number of elements.
+            dtype: element type.
+
+        Returns:
+            array : 64-byte aligned array of `size` elements.
+        """
+        dtype = np.dtype(dtype)
+        nbytes = size * dtype.itemsize
+        if nbytes < MIN_POOLED_BYTES:
+            return _aligned(max(nbytes, dtype.itemsize)).view(dtype)[:size]
+
+        cls = size_class(nbytes)
+        pool = self._pools.get(cls)
+        if pool:
+            block = pool.pop()
+            self.hits += 1
+            self.bytes_cached -= cls
+        else:
+            block = _aligned(cls)
+            self.misses += 1
+        self.bytes_in_use += cls
+        if self.bytes_in_use > self.peak:
+            self.peak = self.bytes_in_use
+
+        holder = _Holder(block, size, dtype)
+        weakref.finalize(holder, self._release, block).atexit = False
+        return np.asarray(holder)
+
+    def zeros(self, size, dtype=np.float64):
+        "Like :meth:`empty`, filled with 0."
+        out = self.empty(size, dtype)
+        out.fill(0)
+        return out
+
+    def _release(self, block):
+        cls = len(block)
+        self.bytes_in_use -= cls
+        if self.bytes_cached + cls > self.limit:
+            return
+        self._pools.setdefault(cls, []).append(block)
+        self.bytes_cached += cls
+
+    def set_limit(self, limit):
+        "Change the pool limit, releasing cached buffers above it."
+        self.limit = limit
+        for pool in self._pools.values():
+            while pool and self.bytes_cached > limit:
+                self.bytes_cached -= len(pool.pop())
+
+    def empty_cache(self):
+        "Release every cached buffer to the system."
+        self._pools = {}
+        self.bytes_cached = 0
+
+    def reset_stats(self):
+        "Zero the hit and miss counters and restart `peak` from now."
+        self.hits = 0
+        self.misses = 0
+        self.peak = getattr(self, "bytes_in_use", 0)
+
+    def stats(self):
+        """
+        Returns:
+            dict : hits, misses, bytes_cached, bytes_in_use and peak.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_cached": self.bytes_cached,
+            "bytes_in_use": self.bytes_in_use,
+            "peak": self.peak,
+        }
+
+
+default_allocator = CachingAllocator()
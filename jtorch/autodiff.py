@@ -1,5 +1,10 @@
 from multiprocessing.spawn import import_main_path
-import uuid
+import functools
+import itertools
+import threading
+
+# Source of `Variable.unique_id`.
+_variable_ids = itertools.count()
 
 
 def wrap_tuple(x):
@@ -19,38 +24,56 @@ class Variable:
     Attributes:
         history (:class:`History`) : the Function calls that created this variable or None if constant
         derivative (number): the derivative with respect to this variable
+        unique_id (int) : distinct for every variable created
         name (string) : an optional name for debugging
     """
 
+    # Graphs hold one variable per op, so they carry no __dict__.
+    __slots__ = ("history", "_derivative", "unique_id", "_name")
+
     def __init__(self, history, name=None):
         assert history is None or isinstance(history, History), history
 
         self.history = history
         self._derivative = None
+        self.unique_id = next(_variable_ids)
+
+        # For debugging can have a name, made up from the id if never given.
+        self._name = name
+
+    @property
+    def name(self):
+        if self._name is None:
+            return "var%d" % self.unique_id
+        return self._name
 
-        # For debugging can have a name.
-        if name is not None:
-            self.name = name
-        else:
-            self.name = str(uuid.uuid4())
+    @name.setter
+    def name(self, name):
+        self._name = name
 
     def requires_grad_(self, val):
         self.history = History(None, None, None)
 
-    def backward(self, d_output=None):
+    def backward(self, d_output=None, retain_graph=False):
         """
         Calls autodiff to fill in the derivatives for the history of this object.
+
+        Args:
+            d_output (number, optional): derivative of the output, 1.0 if not given.
+            retain_graph (bool): keep the saved values and history links so
+                the graph can be backpropagated again. By default they are
+                released as backward goes, see :func:`backpropagate`.
         """
         if d_output is None:
             d_output = 1.0
-        backpropagate(VariableWithDeriv(self, d_output))
+        backpropagate(VariableWithDeriv(self, d_output), retain_graph)
 
     @property
     def derivative(self):
         return self._derivative
 
     def __hash__(self):
-        return hash(self.name)
+        return self.unique_id
 
     def _add_deriv(self, val):
         assert self.history.is_leaf(), "Only leaf variables can have derivatives."
@@ -74,11 +97,24 @@ class Variable:
         return x
 
 
+# Error for a graph whose saved values were released by `backward`.
+FREED_GRAPH = (
+    "Trying to backward through a graph a second time, its saved values "
+    "were released by the first backward. Pass retain_graph=True to the "
+    "first backward to keep them."
+)
+
+# Stands for the saved values of a Context after `release`.
+_RELEASED = object()
+
+
 class Context:
     """
     Context class is used by.
     """
 
+    __slots__ = ("_saved_values", "no_grad")
+
     def __init__(self, no_grad=False):
         self._saved_values = None
         self.no_grad = no_grad
@@ -91,9 +127,91 @@ class Context:
     @property
     def saved_values(self):
         assert not self.no_grad, "Doesn't require grad"
+        if self._saved_values is _RELEASED:
+            raise RuntimeError(FREED_GRAPH)
         assert self._saved_values is not None, "Did you forget to save values?"
         return unwrap_tuple(self._saved_values)
 
+    def release(self):
+        "Drop the saved values, using them afterwards raises."
+        self._saved_values = _RELEASED
+
+
+# Context handed to every forward that does not record a graph. Nothing is
+# saved in it, so one instance serves them all.
+_NO_GRAD_CONTEXT = Context(no_grad=True)
+
+
+class _GradMode(threading.local):
+    "Grad mode of the current thread, on in every new thread."
+
+    enabled = True
+
+
+_grad_mode = _GradMode()
+
+
+def is_grad_enabled():
+    "Whether Functions currently record History for backward in this thread."
+    return _grad_mode.enabled
+
+
+class no_grad:
+    """
+    Context manager that stops Functions from recording History.
+
+    Inside it, :meth:`FunctionBase.apply` builds no :class:`Context` or
+    :class:`History`, forwards save nothing for backward, and outputs are
+    constants, so evaluation keeps no graph alive. Also usable as a
+    decorator (`@no_grad()`).
+
+    Grad mode is per thread: a `no_grad` block only affects the thread
+    that enters it.
+    """
+
+    __slots__ = ("_prev",)
+
+    def __enter__(self):
+        self._prev = _grad_mode.enabled
+        _grad_mode.enabled = False
+
+    def __exit__(self, *exc):
+        _grad_mode.enabled = self._prev
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with type(self)():
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+
+class enable_grad(no_grad):
+    """
+    Context manager that turns recording back on, e.g. inside
+    :class:`no_grad` to recompute a checkpointed segment for backward.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        self._prev = _grad_mode.enabled
+        _grad_mode.enabled = True
+
+
+def inference_mode(fn=None):
+    """
+    Decorator running a function under :class:`no_grad`, as `@inference_mode`
+    or `@inference_mode()`. Without `fn` it is also a context manager.
+
+    Args:
+        fn (callable, optional): function to wrap.
+    """
+    if fn is None:
+        return no_grad()
+    return no_grad()(fn)
+
 
 class History:
     """
@@ -106,6 +224,8 @@ class History:
         inputs (list of inputs) : The inputs that were given when `last_fn.forward` was called.
     """
 
+    __slots__ = ("last_fn", "ctx", "inputs")
+
     def __init__(self, last_fn=None, ctx=None, inputs=None):
         self.last_fn = last_fn
         self.ctx = ctx
@@ -115,12 +235,26 @@ class History:
         return self.last_fn is None
 
     def backprop_step(self, d_output):
+        if self.inputs is None:
+            raise RuntimeError(FREED_GRAPH)
         return self.last_fn.chain_rule(self.ctx, self.inputs, d_output)
 
+    def release(self):
+        """
+        Drop the links to the inputs and the saved values once backward has
+        gone through this step, so they can be freed. The step can not be
+        run again.
+        """
+        self.inputs = None
+        if self.ctx is not None:
+            self.ctx.release()
+
 
 class VariableWithDeriv:
     "Holder for a variable with it derivative."
 
+    __slots__ = ("variable", "deriv")
+
     def __init__(self, variable, deriv):
         self.variable = variable
         self.deriv = variable.expand(deriv)
@@ -150,7 +284,8 @@ class FunctionBase:
                 raw_vals.append(v.get_data())
             else:
                 raw_vals.append(v)
-        ctx = Context(not need_grad)
+        need_grad = need_grad and _grad_mode.enabled
+        ctx = Context() if need_grad else _NO_GRAD_CONTEXT
         c = cls.forward(ctx, *raw_vals)
         assert isinstance(c, cls.data_type), "Expected return typ %s got %s" % (
             cls.data_type,
@@ -180,7 +315,8 @@ class FunctionBase:
         d_inputs = cls.backward(ctx, d_output)
         d_inputs = wrap_tuple(d_inputs)
         for inp, d_input in zip(inputs, d_inputs):
-            if not is_constant(inp):
+            # A None derivative means the input was not used.
+            if not is_constant(inp) and d_input is not None:
                 yield VariableWithDeriv(inp, d_input)
 
 
@@ -192,23 +328,77 @@ def is_constant(val):
     return not isinstance(val, Variable) or val.history is None
 
 
-def backpropagate(final_variable_with_deriv):
+def topological_sort(variable):
+    """
+    The non-constant variables `variable` depends on, each listed before
+    everything it was computed from.
+
+    Variables are told apart by identity, so the graph is walked once
+    however many times an intermediate is reused.
+
+    Args:
+       variable (:class:`Variable`): The output to start from.
+
+    Returns:
+       list of :class:`Variable` : `variable` first, leaves last.
+    """
+    order = []
+    seen = set()
+    stack = [(variable, False)]
+    while stack:
+        var, expanded = stack.pop()
+        if expanded:
+            order.append(var)
+            continue
+        if id(var) in seen:
+            continue
+        seen.add(id(var))
+        stack.append((var, True))
+        if not var.history.is_leaf():
+            if var.history.inputs is None:
+                raise RuntimeError(FREED_GRAPH)
+            for inp in var.history.inputs:
+                if not is_constant(inp) and id(inp) not in seen:
+                    stack.append((inp, False))
+    order.reverse()
+    return order
+
+
+def backpropagate(final_variable_with_deriv, retain_graph=False):
     """
-    Runs a breadth-first search on the computation graph in order to
-    backpropagate derivatives to the leaves.
+    Backpropagate derivatives to the leaves in topological order.
+
+    The derivatives flowing into each variable are summed before its
+    `backprop_step` runs, so every Function's backward is called once and
+    the cost is linear in the size of the graph, even with reuse.
+
+    Unless `retain_graph`, each step is released (:meth:`History.release`)
+    right after it has run, so the activations it saved are freed during
+    backward instead of living as long as the output.
 
     See :doc:`backpropagate` for details on the algorithm
 
     Args:
        final_variable_with_deriv (:class:`VariableWithDeriv`): The final variable
            and its derivative that we want to propagate backward to the leaves.
+       retain_graph (bool): keep the graph for another backward.
     """
-    queue = [final_variable_with_deriv]
-    while queue:
-        cur = queue.pop(0)
-        var = cur.variable
+    final = final_variable_with_deriv.variable
+    derivs = {id(final): final_variable_with_deriv.deriv}
+    for var in topological_sort(final):
+        # Popped so intermediate derivatives are freed as soon as used.
+        deriv = derivs.pop(id(var), None)
+        if deriv is None:
+            # Only reached through inputs whose derivative was None.
+            continue
         if is_leaf(var):
-            cur.variable._add_deriv(cur.deriv)
-        else:
-            for prev in var.history.backprop_step(cur.deriv):
-                queue.append(prev)
+            var._add_deriv(deriv)
+            continue
+        for prev in var.history.backprop_step(deriv):
+            key = id(prev.variable)
+            if key in derivs:
+                derivs[key] = derivs[key] + prev.deriv
+            else:
+                derivs[key] = prev.deriv
+        if not retain_graph:
+            var.history.release()
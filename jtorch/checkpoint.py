@@ -0,0 +1,143 @@
+"""
+Gradient checkpointing.
+
+A checkpointed segment runs its forward under :class:`no_grad`, so none of
+its intermediates are saved, and keeps only its inputs. When backward
+reaches it, the segment is run again with recording on and backpropagated
+on the spot. This trades one extra forward for not holding the segment's
+activations between forward and backward.
+
+Splitting a stack of `n` layers into about `sqrt(n)` checkpointed segments
+(:func:`checkpoint_sequential`) keeps `sqrt(n)` segment inputs plus the
+activations of one segment at a time, instead of all `n` layers' worth.
+
+The state of :data:`default_generator` is replayed for the recomputation,
+so dropout draws the same mask as in the forward pass.
+"""
+
+import math
+from .autodiff import enable_grad, no_grad, is_grad_enabled
+from .generator import default_generator
+from .module import Module
+from .tensor import Function, Tensor
+
+
+class CheckpointFun(Function):
+    @staticmethod
+    def forward(ctx, fn, n_inputs, *args):
+        # `args` are the segment inputs followed by the parameters `fn` uses.
+        # The parameters are only passed so that the output is recorded when
+        # they need grad, they get their derivatives in `backward`.
+        state = default_generator.get_state()
+        with no_grad():
+            out = fn(*args[:n_inputs])
+        ctx.save_for_backward(fn, state, args[:n_inputs])
+        return out
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        fn, state, inputs = ctx.saved_values
+        leaves = []
+        for t in inputs:
+            leaf = Tensor(t._tensor, backend=t.tf)
+            leaf.requires_grad_(True)
+            leaves.append(leaf)
+
+        # Rerun with the random state of the forward, then resume the stream.
+        resume = default_generator.get_state()
+        default_generator.set_state(state)
+        with enable_grad():
+            out = fn(*leaves)
+        default_generator.set_state(resume)
+
+        # Parameters used by `fn` accumulate their derivatives right here.
+        out.backward(grad_output)
+        return (None, None) + tuple(leaf.derivative for leaf in leaves)
+
+
+def _parameters(fns):
+    params = []
+    for fn in fns:
+        if isinstance(fn, Module):
+            params += [p.value for p in fn.parameters()]
+    return params
+
+
+def _checkpoint(fn, inputs, params):
+    if not is_grad_enabled():
+        return fn(*inputs)
+    return CheckpointFun.apply(fn, len(inputs), *inputs, *params)
+
+
+def checkpoint(fn, *inputs):
+    """
+    Run `fn(*inputs)` without saving its intermediates for backward, they
+    are recomputed when backward reaches it.
+
+    The output is recorded if an input needs grad, or if `fn` is a
+    :class:`Module` with parameters. A plain function using parameters it
+    does not get as inputs should be wrapped in a Module
+    (:class:`Checkpointed`) instead.
+
+    Args:
+        fn (callable): function of tensors returning one tensor. It must
+            compute the same thing when called again.
+        *inputs (:class:`Tensor`): its arguments.
+
+    Returns:
+        :class:`Tensor` : `fn(*inputs)`
+    """
+    return _checkpoint(fn, inputs, _parameters([fn]))
+
+
+def checkpoint_sequential(functions, input, segments=None):
+    """
+    Run `functions` one after the other on `input`, checkpointing every
+    segment but the last (whose backward comes first anyway).
+
+    Args:
+        functions (list of callable): layers, e.g. Modules, each taking and
+            returning one tensor.
+        input (:class:`Tensor`): input of the first layer.
+        segments (int, optional): number of segments, about the square root
+            of the number of layers if not given.
+
+    Returns:
+        :class:`Tensor` : output of the last layer.
+    """
+    functions = list(functions)
+    if segments is None:
+        segments = max(1, round(math.sqrt(len(functions))))
+    size = -(-len(functions) // segments)
+
+    def run(fns):
+        def segment(x):
+            for fn in fns:
+                x = fn(x)
+            return x
+
+        return segment
+
+    for start in range(0, len(functions), size):
+        fns = functions[start : start + size]
+        if start + size >= len(functions):
+            return run(fns)(input)
+        input = _checkpoint(run(fns), (input,), _parameters(fns))
+    return input
+
+
+class Checkpointed(Module):
+    """
+    A module whose calls are checkpointed (see :func:`checkpoint`).
+
+    Args:
+        module (:class:`Module`): module to wrap, its parameters become
+            those of the wrapper.
+    """
+
+    def __init__(self, module):
+        super().__init__()
+        self.module = module
+
+    def forward(self, *inputs):
+        return _checkpoint(self.module, inputs, _parameters([self.module]))
@@ -8,6 +8,8 @@ from .tensor_data import (
     MAX_DIMS,
 )
 from .tensor import Function
+from .tensor_data import shape_broadcast, promote_types
+from .functions import transpose, batch_grad
 
 count = cuda.jit(device=True)(count)
 index_to_position = cuda.jit(device=True)(index_to_position)
@@ -48,10 +50,9 @@ def _matrix_multiply(
 
 
 def matrix_multiply(a, b):
-    ls = list(a.shape)
     assert a.shape[-1] == b.shape[-2]
-    ls[-1] = b.shape[-1]
-    out = a.zeros(tuple(ls))
+    batch = shape_broadcast(a.shape[:-2], b.shape[:-2])
+    out = a.zeros(batch + (a.shape[-2], b.shape[-1]), promote_types(a.dtype, b.dtype))
     threadsperblock = 32
     blockspergrid = (out.size + (threadsperblock - 1)) // threadsperblock
     _matrix_multiply[blockspergrid, threadsperblock](
@@ -71,8 +72,8 @@ class MatMul(Function):
     def backward(ctx, grad_output):
         t1, t2 = ctx.saved_values
         return (
-            matrix_multiply(grad_output, t2.permute(0, 2, 1)),
-            matrix_multiply(t1.permute(0, 2, 1), grad_output),
+            batch_grad(t1, lambda: matrix_multiply(grad_output, transpose(t2))),
+            batch_grad(t2, lambda: matrix_multiply(transpose(t1), grad_output)),
         )
 
 
@@ -5,6 +5,8 @@ from .tensor_data import (
     index_to_position,
     broadcast_index,
     shape_broadcast,
+    float_dtype,
+    promote_types,
     MAX_DIMS,
 )
 import numpy
@@ -46,12 +48,12 @@ def tensor_map(fn):
     return cuda.jit()(_map)
 
 
-def map(fn):
+def map(fn, floating=False):
     f = tensor_map(cuda.jit(device=True)(fn))
 
     def ret(a, out=None):
         if out is None:
-            out = a.zeros(a.shape)
+            out = a.empty(dtype=float_dtype(a.dtype) if floating else a.dtype)
 
         threadsperblock = 32
         blockspergrid = (out.size + (threadsperblock - 1)) // threadsperblock
@@ -111,12 +113,13 @@ def tensor_zip(fn):
     return cuda.jit()(_zip)
 
 
-def zip(fn):
+def zip(fn, out_dtype=None):
     f = tensor_zip(cuda.jit(device=True)(fn))
 
     def ret(a, b):
         c_shape = shape_broadcast(a.shape, b.shape)
-        out = a.zeros(c_shape)
+        dtype = promote_types(a.dtype, b.dtype) if out_dtype is None else out_dtype
+        out = a.empty(c_shape, dtype)
         threadsperblock = 32
         blockspergrid = (out.size + (threadsperblock - 1)) // threadsperblock
         f[blockspergrid, threadsperblock](
@@ -184,7 +187,7 @@ def reduce(fn, start=0.0):
             for d in dims:
                 out_shape[d] = 1
             # Other values when not sum.
-            out = a.zeros(tuple(out_shape))
+            out = a.empty(tuple(out_shape), float_dtype(a.dtype))
             out._tensor._storage[:] = start
         diff = len(a.shape) - len(out.shape)
 
@@ -1,16 +1,71 @@
 import numpy as np
 from .tensor_data import (
     count,
-    index_to_position,
-    broadcast_index,
     shape_broadcast,
-    MAX_DIMS,
+    broadcast_strides,
+    coalesce_dims,
+    reduce_dims,
+    float_dtype,
+    promote_types,
 )
+import numba
 from numba import njit, prange
 
 count = njit()(count)
-index_to_position = njit()(index_to_position)
-broadcast_index = njit()(broadcast_index)
+broadcast_strides = njit()(broadcast_strides)
+
+# Work items handed to each thread. A few chunks per thread keeps the
+# threads busy when chunks finish at different speeds.
+CHUNKS_PER_THREAD = 4
+
+
+@njit
+def num_chunks(size):
+    """
+    Number of contiguous chunks to split `size` output positions into, none
+    for an empty output (whose shape cannot be indexed by the odometer).
+    """
+    chunks = CHUNKS_PER_THREAD * numba.get_num_threads()
+    return min(size, chunks)
+
+
+@njit
+def start_index(position, shape, strides, index, pos):
+    """
+    Set up an odometer at output `position`.
+
+    Args:
+        position (int): first output position of the chunk.
+        shape (array): shape being iterated.
+        strides (array): operands x dims strides (see :func:`broadcast_strides`).
+        index (array): filled with the multi-index of `position`.
+        pos (array): filled with each operand's storage position.
+    """
+    count(position, shape, index)
+    for k in range(strides.shape[0]):
+        p = 0
+        for d in range(len(shape)):
+            p += index[d] * strides[k, d]
+        pos[k] = p
+
+
+@njit(inline="always")
+def advance(shape, strides, index, pos):
+    """
+    Step the odometer to the next index in row-major order.
+
+    Each operand position moves by adding a stride, and is rewound when a
+    dimension wraps around, so no div/mod is needed per element.
+    """
+    for d in range(len(shape) - 1, -1, -1):
+        index[d] += 1
+        if index[d] < shape[d]:
+            for k in range(strides.shape[0]):
+                pos[k] += strides[k, d]
+            return
+        index[d] = 0
+        for k in range(strides.shape[0]):
+            pos[k] -= strides[k, d] * (shape[d] - 1)
 
 
 def tensor_map(fn):
@@ -34,14 +89,20 @@ def tensor_map(fn):
             or (out_strides != in_strides).any()
             or (out_shape != in_shape).any()
         ):
-            for i in prange(len(out)):
-                out_index = np.zeros(MAX_DIMS, np.int32)
-                in_index = np.zeros(MAX_DIMS, np.int32)
-                count(i, out_shape, out_index)
-                broadcast_index(out_index, out_shape, in_shape, in_index)
-                o = index_to_position(out_index, out_strides)
-                j = index_to_position(in_index, in_strides)
-                out[o] = fn(in_storage[j])
+            size = len(out)
+            strides = np.empty((2, len(out_shape)), np.int64)
+            strides[0] = out_strides
+            strides[1] = broadcast_strides(out_shape, in_shape, in_strides)
+            chunks = num_chunks(size)
+            for c in prange(chunks):
+                start = c * size // chunks
+                end = (c + 1) * size // chunks
+                index = np.empty(len(out_shape), np.int64)
+                pos = np.empty(2, np.int64)
+                start_index(start, out_shape, strides, index, pos)
+                for _ in range(start, end):
+                    out[pos[0]] = fn(in_storage[pos[1]])
+                    advance(out_shape, strides, index, pos)
         else:
             for i in prange(len(out)):
                 out[i] = fn(in_storage[i])
@@ -50,13 +111,48 @@ def tensor_map(fn):
     return njit(parallel=True)(_map)
 
 
-def map(fn):
-    f = tensor_map(njit()(fn))
+def tensor_map_1d(fn):
+    """
+    Map over a single strided dimension.
+
+    Covers contiguous tensors and anything that coalesces to one dimension
+    (see :func:`coalesce_dims`), including a broadcast scalar (stride 0).
+
+    Args:
+        fn: function mappings floats-to-floats to apply.
+        out (array): storage for out tensor.
+        out_stride (int): stride for out tensor.
+        in_storage (array): storage for in tensor.
+        in_stride (int): stride for in tensor.
+        size (int): number of elements.
+    """
+
+    def _map(out, out_stride, in_storage, in_stride, size):
+        for i in prange(size):
+            out[i * out_stride] = fn(in_storage[i * in_stride])
+
+    return njit(parallel=True)(_map)
+
+
+def map(fn, floating=False):
+    fn = njit()(fn)
+    f = tensor_map(fn)
+    f_1d = tensor_map_1d(fn)
 
     def ret(a, out=None):
         if out is None:
-            out = a.zeros(a.shape)
-        f(*out.tuple(), *a.tuple())
+            out = a.empty(dtype=float_dtype(a.dtype) if floating else a.dtype)
+        out_storage, out_shape, out_strides = out.tuple()
+        in_storage, in_shape, in_strides = a.tuple()
+        shape, (o_st, i_st), _ = coalesce_dims(
+            out_shape,
+            [out_strides, broadcast_strides(out_shape, in_shape, in_strides)],
+        )
+        if len(shape) == 1:
+            f_1d(out_storage, o_st[0], in_storage, i_st[0], shape[0])
+        else:
+            shape = np.array(shape)
+            f(out_storage, shape, np.array(o_st), in_storage, shape, np.array(i_st))
         return out
 
     return ret
@@ -89,17 +185,21 @@ def tensor_zip(fn):
             or (out_strides != b_strides).any()
             or (out_shape != b_shape).any()
         ):
-            for i in prange(len(out)):
-                out_index = np.zeros(MAX_DIMS, np.int32)
-                a_index = np.zeros(MAX_DIMS, np.int32)
-                b_index = np.zeros(MAX_DIMS, np.int32)
-                count(i, out_shape, out_index)
-                o = index_to_position(out_index, out_strides)
-                broadcast_index(out_index, out_shape, a_shape, a_index)
-                j = index_to_position(a_index, a_strides)
-                broadcast_index(out_index, out_shape, b_shape, b_index)
-                k = index_to_position(b_index, b_strides)
-                out[o] = fn(a[j], b[k])
+            size = len(out)
+            strides = np.empty((3, len(out_shape)), np.int64)
+            strides[0] = out_strides
+            strides[1] = broadcast_strides(out_shape, a_shape, a_strides)
+            strides[2] = broadcast_strides(out_shape, b_shape, b_strides)
+            chunks = num_chunks(size)
+            for c in prange(chunks):
+                start = c * size // chunks
+                end = (c + 1) * size // chunks
+                index = np.empty(len(out_shape), np.int64)
+                pos = np.empty(3, np.int64)
+                start_index(start, out_shape, strides, index, pos)
+                for _ in range(start, end):
+                    out[pos[0]] = fn(a[pos[1]], b[pos[2]])
+                    advance(out_shape, strides, index, pos)
         else:
             for i in prange(len(out)):
                 out[i] = fn(a[i], b[i])
@@ -108,14 +208,109 @@ def tensor_zip(fn):
     return njit(parallel=True)(_zip)
 
 
-def zip(fn):
+def tensor_zip_1d(fn):
+    """
+    Zip over a single strided dimension.
+
+    Covers same-shape contiguous operands and a scalar operand (stride 0).
+
+    Args:
+        fn: function mappings two floats to float to apply.
+        out (array): storage for `out` tensor.
+        out_stride (int): stride for `out` tensor.
+        a_storage (array): storage for `a` tensor.
+        a_stride (int): stride for `a` tensor.
+        b_storage (array): storage for `b` tensor.
+        b_stride (int): stride for `b` tensor.
+        size (int): number of elements.
+    """
+
+    def _zip(out, out_stride, a, a_stride, b, b_stride, size):
+        for i in prange(size):
+            out[i * out_stride] = fn(a[i * a_stride], b[i * b_stride])
+
+    return njit(parallel=True)(_zip)
+
+
+def tensor_zip_2d(fn):
+    """
+    Zip over two strided dimensions.
+
+    Covers row broadcast (one operand has stride 0 on the rows) and column
+    broadcast (stride 0 on the columns), such as adding a bias to a batch.
+
+    Args:
+        fn: function mappings two floats to float to apply.
+        out (array): storage for `out` tensor.
+        out_strides (array): (row, column) strides for `out` tensor.
+        a_storage (array): storage for `a` tensor.
+        a_strides (array): (row, column) strides for `a` tensor.
+        b_storage (array): storage for `b` tensor.
+        b_strides (array): (row, column) strides for `b` tensor.
+        rows (int): number of rows.
+        cols (int): number of columns.
+    """
+
+    def _zip(out, out_strides, a, a_strides, b, b_strides, rows, cols):
+        for r in prange(rows):
+            o = r * out_strides[0]
+            j = r * a_strides[0]
+            k = r * b_strides[0]
+            for c in range(cols):
+                out[o + c * out_strides[1]] = fn(
+                    a[j + c * a_strides[1]], b[k + c * b_strides[1]]
+                )
+
+    return njit(parallel=True)(_zip)
+
 
-    f = tensor_zip(njit()(fn))
+def zip(fn, out_dtype=None):
+    fn = njit()(fn)
+    f = tensor_zip(fn)
+    f_1d = tensor_zip_1d(fn)
+    f_2d = tensor_zip_2d(fn)
 
     def ret(a, b):
         c_shape = shape_broadcast(a.shape, b.shape)
-        out = a.zeros(c_shape)
-        f(*out.tuple(), *a.tuple(), *b.tuple())
+        dtype = promote_types(a.dtype, b.dtype) if out_dtype is None else out_dtype
+        out = a.empty(c_shape, dtype)
+        out_storage, out_shape, out_strides = out.tuple()
+        a_storage, a_shape, a_strides = a.tuple()
+        b_storage, b_shape, b_strides = b.tuple()
+        shape, (o_st, a_st, b_st), _ = coalesce_dims(
+            out_shape,
+            [
+                out_strides,
+                broadcast_strides(out_shape, a_shape, a_strides),
+                broadcast_strides(out_shape, b_shape, b_strides),
+            ],
+        )
+        if len(shape) == 1:
+            f_1d(out_storage, o_st[0], a_storage, a_st[0], b_storage, b_st[0], shape[0])
+        elif len(shape) == 2:
+            f_2d(
+                out_storage,
+                np.array(o_st),
+                a_storage,
+                np.array(a_st),
+                b_storage,
+                np.array(b_st),
+                shape[0],
+                shape[1],
+            )
+        else:
+            shape = np.array(shape)
+            f(
+                out_storage,
+                shape,
+                np.array(o_st),
+                a_storage,
+                shape,
+                np.array(a_st),
+                b_storage,
+                shape,
+                np.array(b_st),
+            )
         return out
 
     return ret
@@ -141,27 +336,77 @@ def tensor_reduce(fn):
         out, out_shape, out_strides, a, a_shape, a_strides, reduce_shape, reduce_size
     ):
         # ASSIGN3
-        for i in prange(len(out)):
-            out_index = np.zeros(MAX_DIMS, np.int32)
-            a_index = np.zeros(MAX_DIMS, np.int32)
+        # Outer odometer walks the kept positions of `a` (reduced dims pinned
+        # to 0), inner odometer walks the reduced dims from that base.
+        dims = len(a_shape)
+        keep_shape = np.empty(dims, np.int64)
+        outer = np.empty((2, dims), np.int64)
+        inner = np.empty((1, dims), np.int64)
+        outer[0] = broadcast_strides(a_shape, out_shape, out_strides)
+        outer[1] = a_strides
+        inner[0] = a_strides
+        for d in range(dims):
+            keep_shape[d] = 1 if reduce_shape[d] != 1 else a_shape[d]
+        size = len(out)
+        chunks = num_chunks(size)
+        for c in prange(chunks):
+            start = c * size // chunks
+            end = (c + 1) * size // chunks
+            index = np.empty(dims, np.int64)
+            pos = np.empty(2, np.int64)
+            r_index = np.empty(dims, np.int64)
+            r_pos = np.empty(1, np.int64)
+            start_index(start, keep_shape, outer, index, pos)
+            for _ in range(start, end):
+                acc = out[pos[0]]
+                r_index[:] = 0
+                r_pos[0] = pos[1]
+                for s in range(reduce_size):
+                    acc = fn(acc, a[r_pos[0]])
+                    advance(reduce_shape, inner, r_index, r_pos)
+                out[pos[0]] = acc
+                advance(keep_shape, outer, index, pos)
+        # END ASSIGN3
+
+    return njit(parallel=True)(_reduce)
+
 
-            count(i, out_shape, out_index)
-            o = index_to_position(out_index, out_strides)
+def tensor_reduce_2d(fn):
+    """
+    Reduce a (kept, reduced) strided layout.
 
+    Covers a full reduction and a reduction over one (coalesced) axis, e.g.
+    summing the last contiguous axis or summing over the batch.
+
+    Args:
+        fn: reduction function mapping two floats to float.
+        out (array): storage for `out` tensor.
+        out_stride (int): stride of `out` along the kept dimension.
+        a_storage (array): storage for `a` tensor.
+        a_keep_stride (int): stride of `a` along the kept dimension.
+        a_reduce_stride (int): stride of `a` along the reduced dimension.
+        keep_size (int): size of the kept dimension.
+        reduce_size (int): size of the reduced dimension.
+    """
+
+    def _reduce(
+        out, out_stride, a, a_keep_stride, a_reduce_stride, keep_size, reduce_size
+    ):
+        for i in prange(keep_size):
+            o = i * out_stride
+            j = i * a_keep_stride
+            acc = out[o]
             for s in range(reduce_size):
-                count(s, reduce_shape, a_index)
-                for k in range(len(reduce_shape)):
-                    if reduce_shape[k] != 1:
-                        out_index[k] = a_index[k]
-                j = index_to_position(out_index, a_strides)
-                out[o] = fn(out[o], a[j])
-        # END ASSIGN3
+                acc = fn(acc, a[j + s * a_reduce_stride])
+            out[o] = acc
 
     return njit(parallel=True)(_reduce)
 
 
 def reduce(fn, start=0.0):
-    f = tensor_reduce(njit()(fn))
+    fn = njit()(fn)
+    f = tensor_reduce(fn)
+    f_2d = tensor_reduce_2d(fn)
 
     def ret(a, dims=None, out=None):
         if out is None:
@@ -169,21 +414,49 @@ def reduce(fn, start=0.0):
             for d in dims:
                 out_shape[d] = 1
             # Other values when not sum.
-            out = a.zeros(tuple(out_shape))
+            out = a.empty(tuple(out_shape), float_dtype(a.dtype))
             out._tensor._storage[:] = start
 
-        diff = len(a.shape) - len(out.shape)
-
-        reduce_shape = []
-        reduce_size = 1
-        for i, s in enumerate(a.shape):
-            if i < diff or out.shape[i - diff] == 1:
-                reduce_shape.append(s)
-                reduce_size *= s
-            else:
-                reduce_shape.append(1)
-        # assert len(out.shape) == len(a.shape)
-        f(*out.tuple(), *a.tuple(), np.array(reduce_shape), reduce_size)
+        out_storage, out_shape, out_strides = out.tuple()
+        a_storage, a_shape, a_strides = a.tuple()
+        shape, (o_st, a_st), kinds = reduce_dims(
+            out_shape, out_strides, a_shape, a_strides
+        )
+        if len(shape) == 1 or (len(shape) == 2 and kinds[0] != kinds[1]):
+            keep_size, keep_stride, a_keep_stride = 1, 0, 0
+            reduce_size, a_reduce_stride = 1, 0
+            for d, kind in enumerate(kinds):
+                if kind:
+                    reduce_size, a_reduce_stride = shape[d], a_st[d]
+                else:
+                    keep_size, keep_stride, a_keep_stride = shape[d], o_st[d], a_st[d]
+            f_2d(
+                out_storage,
+                keep_stride,
+                a_storage,
+                a_keep_stride,
+                a_reduce_stride,
+                keep_size,
+                reduce_size,
+            )
+        else:
+            keep_shape = np.array(shape)
+            reduce_shape = np.array(shape)
+            for d, kind in enumerate(kinds):
+                if kind:
+                    keep_shape[d] = 1
+                else:
+                    reduce_shape[d] = 1
+            f(
+                out_storage,
+                keep_shape,
+                np.array(o_st),
+                a_storage,
+                np.array(shape),
+                np.array(a_st),
+                reduce_shape,
+                int(reduce_shape.prod()),
+            )
         return out
 
     return ret
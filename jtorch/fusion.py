@@ -0,0 +1,256 @@
+"""
+Elementwise fusion.
+
+With fusion turned on (`make_tensor_functions(backend, fuse=True)`), `map`
+and `zip` do not compute anything. They record a :class:`LazyData` node and
+return a tensor wrapping it. A chain of such nodes is compiled into one
+Numba kernel that reads each input once and writes one output. The kernel
+is cached by the structure of the expression, so a training loop compiles
+each distinct chain once.
+
+The chain is materialized the first time anything other than its shape is
+needed: a reduction, a view or permute, matmul, indexing, or `backward`
+pushing a gradient through `expand`.
+"""
+
+import weakref
+import numpy as np
+from numba import njit, prange
+from .allocator import default_allocator
+from .fast_ops import num_chunks, start_index, advance
+from .tensor_data import (
+    TensorData,
+    shape_broadcast,
+    broadcast_strides,
+    coalesce_dims,
+    float_dtype,
+    pending_reads,
+    promote_types,
+)
+
+# Upper bound on the number of operations in one fused kernel. Longer chains
+# are cut by materializing their inputs first.
+MAX_FUSED_OPS = 32
+
+_jit_fns = {}
+_kernels = {}
+
+
+def _jit(fn):
+    if fn not in _jit_fns:
+        _jit_fns[fn] = njit()(fn)
+    return _jit_fns[fn]
+
+
+class LazyData:
+    """
+    A pending elementwise computation with the interface of :class:`TensorData`.
+
+    Attributes:
+        fn (function): scalar function from `operators` applied to `args`.
+        args (list): :class:`LazyData` or :class:`TensorData` inputs.
+        shape (tuple): broadcast shape of the result.
+        dtype (dtype): type of the result.
+
+    Inputs are read when the result is materialized, not when it is built.
+    A write to an input through `set` (or a fill) materializes the pending
+    results reading it first, so they still see the old values.
+    """
+
+    def __init__(self, fn, args, shape, dtype):
+        self.fn = fn
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.dims = len(shape)
+        self.size = int(np.prod(shape))
+        self._value = None
+        self.args = []
+        # `_version` of each TensorData argument (None for lazy ones).
+        self._versions = []
+        self.n_ops = 1
+        for arg in args:
+            if isinstance(arg, LazyData) and arg._value is not None:
+                arg = arg._value
+            if isinstance(arg, LazyData):
+                if self.n_ops + arg.n_ops > MAX_FUSED_OPS:
+                    arg = arg.materialize()
+                else:
+                    self.n_ops += arg.n_ops
+            if isinstance(arg, LazyData):
+                self._versions.append(None)
+            else:
+                pending_reads.setdefault(id(arg._storage), weakref.WeakSet()).add(self)
+                self._versions.append(arg._version)
+            self.args.append(arg)
+
+    def __del__(self):
+        self._forget()
+
+    def _forget(self):
+        "Leave the pending reads of the inputs' storages."
+        for arg in self.__dict__.get("args") or ():
+            if not isinstance(arg, LazyData):
+                pending = pending_reads.get(id(arg._storage))
+                if pending is not None:
+                    pending.discard(self)
+                    if not pending:
+                        del pending_reads[id(arg._storage)]
+
+    def __getattr__(self, name):
+        # Only reached for attributes of the materialized TensorData.
+        if name.startswith("__") or name in ("_value", "args", "_versions"):
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+    def structure(self, leaves, leaf_ids):
+        """
+        Describe the expression for the kernel cache.
+
+        Args:
+            leaves (list): filled with the distinct :class:`TensorData` inputs.
+            leaf_ids (dict): id of an input -> its position in `leaves`.
+
+        Returns:
+            tuple : nested `(fn, *children)` with leaves as `("x", i)`.
+        """
+        children = []
+        for arg, version in zip(self.args, self._versions):
+            if isinstance(arg, LazyData) and arg._value is not None:
+                arg = arg._value
+            if isinstance(arg, LazyData):
+                children.append(arg.structure(leaves, leaf_ids))
+            else:
+                if version is not None and arg._version != version:
+                    # Written without `set`, e.g. through another view.
+                    raise RuntimeError(
+                        "An input of a fused expression was modified in place "
+                        "before the expression was computed."
+                    )
+                if id(arg) not in leaf_ids:
+                    leaf_ids[id(arg)] = len(leaves)
+                    leaves.append(arg)
+                children.append(("x", leaf_ids[id(arg)]))
+        return (self.fn, *children)
+
+    def materialize(self):
+        "Run the fused kernel (once) and return the resulting :class:`TensorData`."
+        if self._value is None:
+            leaves = []
+            key = self.structure(leaves, {})
+            kernel = fused_kernel(key, len(leaves))
+
+            out = TensorData(default_allocator.empty(self.size, self.dtype), self.shape)
+            shape, strides, _ = coalesce_dims(
+                out._shape,
+                [out._strides]
+                + [broadcast_strides(out._shape, x._shape, x._strides) for x in leaves],
+            )
+            kernel(
+                out._storage,
+                np.array(shape),
+                np.array(strides[1:]),
+                *[x._storage for x in leaves],
+            )
+            self._value = out
+            # Drop the expression so its inputs can be freed.
+            self._forget()
+            self.args = None
+            self._versions = None
+        return self._value
+
+
+def _expression(key, fn_names):
+    if key[0] == "x":
+        return f"x{key[1]}[pos[{key[1]}]]"
+    fn, *children = key
+    if fn not in fn_names:
+        fn_names[fn] = f"f{len(fn_names)}"
+    args = ", ".join(_expression(child, fn_names) for child in children)
+    return f"{fn_names[fn]}({args})"
+
+
+def fused_kernel(key, n_leaves):
+    """
+    Compile (or fetch from the cache) the kernel for an expression structure.
+
+    The generated kernel walks the output with the FastOps odometer
+    (see :func:`jtorch.fast_ops.advance`) keeping one storage position per
+    input, and evaluates the whole expression per element.
+
+    Args:
+        key (tuple): expression structure from :meth:`LazyData.structure`.
+        n_leaves (int): number of distinct inputs.
+
+    Returns:
+        function : kernel(out, shape, strides, *inputs)
+    """
+    if key in _kernels:
+        return _kernels[key]
+
+    fn_names = {}
+    expression = _expression(key, fn_names)
+    inputs = ", ".join(f"x{i}" for i in range(n_leaves))
+    source = f"""
+def _fused(out, shape, strides, {inputs}):
+    size = len(out)
+    chunks = num_chunks(size)
+    for c in prange(chunks):
+        start = c * size // chunks
+        end = (c + 1) * size // chunks
+        index = np.empty(len(shape), np.int64)
+        pos = np.empty({n_leaves}, np.int64)
+        start_index(start, shape, strides, index, pos)
+        for i in range(start, end):
+            out[i] = {expression}
+            advance(shape, strides, index, pos)
+"""
+    scope = {
+        "np": np,
+        "prange": prange,
+        "num_chunks": num_chunks,
+        "start_index": start_index,
+        "advance": advance,
+    }
+    for fn, name in fn_names.items():
+        scope[name] = _jit(fn)
+    exec(source, scope)
+    kernel = njit(parallel=True)(scope["_fused"])
+    _kernels[key] = kernel
+    return kernel
+
+
+def fused_map(fn, eager, floating=False):
+    """
+    Lazy version of a backend `map`.
+
+    Args:
+        fn: function from float-to-float to apply.
+        eager: the backend map, used when an `out` tensor is given.
+        floating (bool): the result is floating point whatever the input.
+    """
+
+    def ret(a, out=None):
+        if out is not None:
+            return eager(a, out=out)
+        dtype = float_dtype(a.dtype) if floating else a.dtype
+        return a._new(LazyData(fn, [a._tensor], a.shape, dtype))
+
+    return ret
+
+
+def fused_zip(fn, out_dtype=None):
+    """
+    Lazy version of a backend `zip`.
+
+    Args:
+        fn: function from two floats-to-float to apply.
+        out_dtype (dtype, optional): type of the result, promoted from the
+            inputs if not given.
+    """
+
+    def ret(a, b):
+        shape = shape_broadcast(a.shape, b.shape)
+        dtype = promote_types(a.dtype, b.dtype) if out_dtype is None else out_dtype
+        return a._new(LazyData(fn, [a._tensor, b._tensor], shape, dtype))
+
+    return ret
@@ -0,0 +1,101 @@
+"""
+Seedable random number generation.
+
+Random tensors are filled by a :class:`numpy.random.Generator` writing
+straight into their float64 storage, rather than one Python call per
+element. Functions that draw random numbers take an optional `generator`
+and fall back to :data:`default_generator`.
+"""
+
+import numpy as np
+
+
+class Generator:
+    """
+    A stream of random numbers.
+
+    Args:
+        seed (int, optional): seed of the stream, fresh OS entropy if not given.
+    """
+
+    def __init__(self, seed=None):
+        self.manual_seed(seed)
+
+    def manual_seed(self, seed):
+        "Restart the stream from `seed`. Returns the generator."
+        self._seed_seq = np.random.SeedSequence(seed)
+        self._rng = np.random.Generator(np.random.PCG64(self._seed_seq))
+        return self
+
+    def initial_seed(self):
+        "The seed (entropy) the stream was started from."
+        return self._seed_seq.entropy
+
+    def get_state(self):
+        "A copy of the state, for :meth:`set_state`."
+        return self._rng.bit_generator.state
+
+    def set_state(self, state):
+        "Rewind or fast-forward to a state from :meth:`get_state`."
+        self._rng.bit_generator.state = state
+
+    def spawn(self, n):
+        """
+        Independent child streams, e.g. one per thread.
+
+        Args:
+            n (int): number of children.
+
+        Returns:
+            list of :class:`Generator`
+        """
+        children = []
+        for seq in self._seed_seq.spawn(n):
+            child = Generator.__new__(Generator)
+            child._seed_seq = seq
+            child._rng = np.random.Generator(np.random.PCG64(seq))
+            children.append(child)
+        return children
+
+    def draw_seed(self):
+        "A 64-bit seed for a counter-based generator (e.g. dropout masks)."
+        return int(self._rng.integers(0, 2**64, dtype=np.uint64))
+
+    def uniform(self, out, low=0.0, high=1.0):
+        """
+        Fill `out` with samples from U[low, high).
+
+        Args:
+            out (array): contiguous float32 or float64 array, filled in place.
+        """
+        self._rng.random(out=out, dtype=out.dtype)
+        if low != 0.0 or high != 1.0:
+            out *= high - low
+            out += low
+        return out
+
+    def normal(self, out, mean=0.0, std=1.0):
+        """
+        Fill `out` with samples from N(mean, std^2).
+
+        Args:
+            out (array): contiguous float32 or float64 array, filled in place.
+        """
+        self._rng.standard_normal(out=out, dtype=out.dtype)
+        if mean != 0.0 or std != 1.0:
+            out *= std
+            out += mean
+        return out
+
+
+default_generator = Generator()
+
+
+def manual_seed(seed):
+    """
+    Seed the default generator.
+
+    Returns:
+        :class:`Generator` : the default generator.
+    """
+    return default_generator.manual_seed(seed)
@@ -0,0 +1,211 @@
+"""
+Bit-packed boolean masks.
+
+A :class:`PackedMask` stores one bit per element, 64 times smaller than a
+float64 0/1 tensor. Masks are produced directly by comparison kernels
+(:func:`compare`) and consumed by :func:`select`, which picks between two
+tensors per element in the same pass, so a mask is never expanded or
+multiplied back into an activation.
+"""
+
+import numpy as np
+from numba import njit, prange
+from .allocator import default_allocator
+from .fast_ops import num_chunks, start_index, advance
+from .tensor_data import (
+    TensorData,
+    shape_broadcast,
+    broadcast_strides,
+    coalesce_dims,
+    promote_types,
+    scalar_dtype,
+    strides_from_shape,
+)
+
+# Comparisons understood by `compare`.
+LT, EQ, GT, NE = 0, 1, 2, 3
+
+
+class PackedMask:
+    """
+    Boolean tensor with 1 bit per element.
+
+    Element `i` in row-major order is bit `i % 8` of byte `i // 8`.
+
+    Attributes:
+        bits (array): uint8 storage.
+        shape (tuple): shape of the mask.
+        size (int): number of elements.
+    """
+
+    def __init__(self, bits, shape):
+        self.bits = bits
+        self.shape = tuple(shape)
+        self.size = int(np.prod(self.shape))
+        assert len(bits) == (self.size + 7) // 8
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def to_numpy(self):
+        "The mask as a bool array."
+        flat = np.unpackbits(self.bits, count=self.size, bitorder="little")
+        return flat.astype(bool).reshape(self.shape)
+
+    @staticmethod
+    def from_numpy(array):
+        "Pack an array, true where it is non-zero."
+        array = np.asarray(array)
+        bits = np.packbits(array.ravel() != 0, bitorder="little")
+        return PackedMask(bits, array.shape)
+
+
+@njit(inline="always")
+def _compare(x, y, op):
+    if op == 0:
+        return x < y
+    if op == 1:
+        return x == y
+    if op == 2:
+        return x > y
+    return x != y
+
+
+@njit(parallel=True)
+def _pack_compare(bits, size, shape, strides, a, b, op):
+    """
+    Pack `a op b` over `shape` into `bits`, 8 elements per byte. Chunks
+    are whole bytes so no two threads write the same byte.
+    """
+    nbytes = len(bits)
+    chunks = num_chunks(nbytes)
+    for c in prange(chunks):
+        start = c * nbytes // chunks
+        end = (c + 1) * nbytes // chunks
+        index = np.empty(len(shape), np.int64)
+        pos = np.empty(2, np.int64)
+        start_index(start * 8, shape, strides, index, pos)
+        for j in range(start, end):
+            byte = 0
+            for k in range(min(8, size - 8 * j)):
+                if _compare(a[pos[0]], b[pos[1]], op):
+                    byte |= 1 << k
+                advance(shape, strides, index, pos)
+            bits[j] = byte
+
+
+@njit(parallel=True)
+def _pack_compare_1d(bits, size, a, a_stride, b, b_stride, op):
+    "`_pack_compare` over a single strided dimension."
+    for j in prange(len(bits)):
+        byte = 0
+        for k in range(min(8, size - 8 * j)):
+            i = 8 * j + k
+            if _compare(a[i * a_stride], b[i * b_stride], op):
+                byte |= 1 << k
+        bits[j] = byte
+
+
+@njit(parallel=True)
+def _select_1d(out, x, x_stride, y, y_stride, bits):
+    "`_select` over a single strided dimension."
+    for i in prange(len(out)):
+        if (bits[i >> 3] >> (i & 7)) & 1:
+            out[i] = x[i * x_stride]
+        else:
+            out[i] = y[i * y_stride]
+
+
+@njit(parallel=True)
+def _select(out, shape, strides, x, y, bits):
+    "`out[i] = x if bit i else y`, with `out` contiguous."
+    size = len(out)
+    chunks = num_chunks(size)
+    for c in prange(chunks):
+        start = c * size // chunks
+        end = (c + 1) * size // chunks
+        index = np.empty(len(shape), np.int64)
+        pos = np.empty(2, np.int64)
+        start_index(start, shape, strides, index, pos)
+        for i in range(start, end):
+            if (bits[i >> 3] >> (i & 7)) & 1:
+                out[i] = x[pos[0]]
+            else:
+                out[i] = y[pos[1]]
+            advance(shape, strides, index, pos)
+
+
+def _operand(t, other):
+    """
+    Storage, shape and strides of a tensor, or of a scalar as a 1-element
+    tensor typed against the `other` operand like in tensor arithmetic.
+    """
+    if isinstance(t, (int, float)):
+        return np.array([t], scalar_dtype(other.dtype, t)), (1,), (0,)
+    return t._tensor._storage, t.shape, t._tensor.strides
+
+
+def _layout(shape, *operands):
+    "Coalesced shape and (contiguous, *operand) strides over `shape`."
+    aligned = [strides_from_shape(shape)]
+    aligned += [broadcast_strides(shape, s, st) for _, s, st in operands]
+    new_shape, strides, _ = coalesce_dims(shape, aligned)
+    return np.array(new_shape), np.array(strides[1:], np.int64)
+
+
+def compare(a, b, op):
+    """
+    Compare two tensors (or a tensor and a scalar) into a packed mask.
+
+    Args:
+        a (:class:`Tensor` or float): left operand.
+        b (:class:`Tensor` or float): right operand, broadcast with `a`.
+        op (int): `LT`, `EQ`, `GT` or `NE`.
+
+    Returns:
+        :class:`PackedMask` : mask of the broadcast shape.
+    """
+    a, b = _operand(a, b), _operand(b, a)
+    shape = shape_broadcast(a[1], b[1])
+    size = int(np.prod(shape))
+    bits = default_allocator.empty((size + 7) // 8, np.uint8)
+    layout, strides = _layout(shape, a, b)
+    if len(layout) == 1:
+        _pack_compare_1d(bits, size, a[0], strides[0, 0], b[0], strides[1, 0], op)
+    else:
+        _pack_compare(bits, size, layout, strides, a[0], b[0], op)
+    return PackedMask(bits, shape)
+
+
+def pack(t):
+    "Packed mask of the non-zero elements of a tensor."
+    return compare(t, 0, NE)
+
+
+def select(mask, x, y):
+    """
+    Pick `x` where `mask` is set and `y` elsewhere, in one pass.
+
+    Multiplying by a mask is `select(mask, x, 0.0)`.
+
+    Args:
+        mask (:class:`PackedMask`): condition.
+        x (:class:`Tensor` or float): values where set, broadcast to the
+            shape of the mask.
+        y (:class:`Tensor` or float): values elsewhere, broadcast likewise.
+
+    Returns:
+        :class:`Tensor` : contiguous tensor of the shape of the mask.
+    """
+    template = y if isinstance(x, (int, float)) else x
+    x, y = _operand(x, y), _operand(y, x)
+    dtype = promote_types(x[0].dtype, y[0].dtype)
+    assert shape_broadcast(mask.shape, shape_broadcast(x[1], y[1])) == mask.shape
+    out = default_allocator.empty(mask.size, dtype)
+    layout, strides = _layout(mask.shape, x, y)
+    if len(layout) == 1:
+        _select_1d(out, x[0], strides[0, 0], y[0], strides[1, 0], mask.bits)
+    else:
+        _select(out, layout, strides, x[0], y[0], mask.bits)
+    return template._new(TensorData(out, mask.shape))
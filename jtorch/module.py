@@ -1,4 +1,5 @@
 ## Module
+from .autodiff import no_grad
 
 
 class Module:
@@ -7,6 +8,7 @@ class Module:
         _modules (dict of name x :class:`Module`): Storage of the child modules
         _parameters (dict of name x :class:`Parameter`): Storage of the module's parameters
         mode (string): Mode of operation, can be {"train", "eval"}.
+        no_grad (bool): Whether calls in eval mode run under :class:`no_grad`.
 
     """
 
@@ -14,6 +16,7 @@ class Module:
         self._modules = {}
         self._parameters = {}
         self.mode = "train"
+        self.no_grad = False
 
     def modules(self):
         "Return the child modules of this module."
@@ -24,12 +27,19 @@ class Module:
         for m in self.modules():
             m.train()
         self.mode = "train"
+        self.no_grad = False
 
-    def eval(self):
-        "Set the mode of this module and all descendent modules to `eval`."
+    def eval(self, no_grad=False):
+        """
+        Set the mode of this module and all descendent modules to `eval`.
+
+        Args:
+            no_grad (bool): also record no graph when the module is called.
+        """
         for m in self.modules():
-            m.eval()
+            m.eval(no_grad)
         self.mode = "eval"
+        self.no_grad = no_grad
 
     def named_parameters(self):
         """
@@ -87,6 +97,9 @@ class Module:
         return self.__getattribute__(key)
 
     def __call__(self, *args, **kwargs):
+        if self.mode == "eval" and self.no_grad:
+            with no_grad():
+                return self.forward(*args, **kwargs)
         return self.forward(*args, **kwargs)
 
     def forward(self):
@@ -0,0 +1,307 @@
+"""
+Vectorized NumPy backend.
+
+Tensors are never iterated element by element. Each `TensorData` is turned into
+a strided `ndarray` view over its storage (no copy) and the work is handed to
+the matching NumPy ufunc, so there is no Python loop per element and no JIT
+warmup.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from . import operators
+from .tensor_data import shape_broadcast, float_dtype, promote_types
+
+
+def strided_view(storage, shape, strides):
+    """
+    View `storage` as an N-d array without copying.
+
+    Args:
+        storage (array): 1-D storage of a tensor.
+        shape (array-like): tensor shape.
+        strides (array-like): tensor strides (in elements, not bytes).
+
+    Returns:
+        array : N-d view sharing memory with `storage`.
+    """
+    itemsize = storage.itemsize
+    return as_strided(
+        storage,
+        shape=tuple(int(s) for s in shape),
+        strides=tuple(int(s) * itemsize for s in strides),
+    )
+
+
+def _sigmoid(x, out):
+    e = np.exp(-np.abs(x))
+    np.divide(np.where(x >= 0, 1.0, e), 1.0 + e, out=out)
+
+
+def _relu_back(x, y, out):
+    np.copyto(out, np.where(x > 0, y, 0.0))
+
+
+def _log(x, out):
+    np.log(x + operators.EPSILON, out=out)
+
+
+def _log_back(x, y, out):
+    np.divide(y, x + operators.EPSILON, out=out)
+
+
+def _inv(x, out):
+    np.divide(1.0, x, out=out)
+
+
+def _inv_back(x, y, out):
+    np.divide(-y, x * x, out=out)
+
+
+# Vectorized equivalents of the scalar functions in `operators`.
+# Each entry is called as `vfn(*inputs, out=out)`.
+VECTORIZED = {
+    operators.id: lambda x, out: np.copyto(out, x, casting="unsafe"),
+    operators.neg: np.negative,
+    operators.add: np.add,
+    operators.mul: np.multiply,
+    operators.max: np.maximum,
+    operators.lt: np.less,
+    operators.eq: np.equal,
+    operators.exp: np.exp,
+    operators.sigmoid: _sigmoid,
+    operators.relu: lambda x, out: np.maximum(x, 0, out=out),
+    operators.relu_back: _relu_back,
+    operators.log: _log,
+    operators.log_back: _log_back,
+    operators.inv: _inv,
+    operators.inv_back: _inv_back,
+}
+
+# Ufuncs whose `reduce` matches the scalar reduction function.
+REDUCERS = {
+    operators.add: np.add,
+    operators.mul: np.multiply,
+    operators.max: np.maximum,
+}
+
+
+def vectorize(fn, nargs):
+    """
+    Find the vectorized version of `fn`.
+
+    Functions without a NumPy equivalent fall back to `np.vectorize`, which is
+    correct but runs `fn` once per element.
+    """
+    if fn in VECTORIZED:
+        return VECTORIZED[fn]
+    vfn = np.vectorize(fn, otypes=[np.float64])
+
+    def _fallback(*args, out):
+        np.copyto(out, vfn(*args[:nargs]), casting="unsafe")
+
+    return _fallback
+
+
+def tensor_map(fn):
+    """
+    Higher-order tensor map function.
+
+    Args:
+        fn: function from float-to-float to apply.
+        out (array): storage for out tensor.
+        out_shape (array): shape for out tensor.
+        out_strides (array): strides for out tensor.
+        in_storage (array): storage for in tensor.
+        in_shape (array): shape for in tensor.
+        in_strides (array): strides for in tensor.
+
+    Returns:
+       None : Fills in `out`.
+    """
+    vfn = vectorize(fn, 1)
+
+    def _map(out, out_shape, out_strides, in_storage, in_shape, in_strides):
+        with np.errstate(all="ignore"):
+            vfn(
+                strided_view(in_storage, in_shape, in_strides),
+                out=strided_view(out, out_shape, out_strides),
+            )
+
+    return _map
+
+
+def map(fn, floating=False):
+    """
+    Higher-order tensor map function.
+
+    Args:
+        fn: function from float-to-float to apply.
+        floating (bool): the result is floating point whatever the input
+            (see :func:`float_dtype`), otherwise it has the type of `a`.
+        a (:class:`TensorData`): tensor to map over
+        out (:class:`TensorData`): optional, tensor data to fill in,
+        should broadcast with `a`.
+    Returns:
+       :class:`TensorData` : new tensor data
+    """
+
+    f = tensor_map(fn)
+
+    def ret(a, out=None):
+        if out is None:
+            out = a.empty(dtype=float_dtype(a.dtype) if floating else a.dtype)
+        f(*out.tuple(), *a.tuple())
+        return out
+
+    return ret
+
+
+def tensor_zip(fn):
+    """
+    Higher-order tensor zipWith (or map2) function.
+
+    Args:
+        fn: function mapping two floats to float to apply.
+        out (array): storage for `out` tensor.
+        out_shape (array): shape for `out` tensor.
+        out_strides (array): strides for `out` tensor.
+        a_storage (array): storage for `a` tensor.
+        a_shape (array): shape for `a` tensor.
+        a_strides (array): strides for `a` tensor.
+        b_storage (array): storage for `b` tensor.
+        b_shape (array): shape for `b` tensor.
+        b_strides (array): strides for `b` tensor.
+
+    Returns:
+       None : Fills in `out`.
+    """
+    vfn = vectorize(fn, 2)
+
+    def _zip(out, out_shape, out_strides, a, a_shape, a_strides, b, b_shape, b_strides):
+        with np.errstate(all="ignore"):
+            vfn(
+                strided_view(a, a_shape, a_strides),
+                strided_view(b, b_shape, b_strides),
+                out=strided_view(out, out_shape, out_strides),
+            )
+
+    return _zip
+
+
+def zip(fn, out_dtype=None):
+    """
+    Higher-order tensor zip function.
+
+    Args:
+        fn: function from two floats-to-float to apply.
+        out_dtype (dtype, optional): type of the result (e.g. bool for
+            comparisons), promoted from `a` and `b` if not given.
+        a (:class:`TensorData`): tensor to zip over
+        b (:class:`TensorData`): tensor to zip over
+    Returns:
+       :class:`TensorData` : new tensor data
+    """
+
+    f = tensor_zip(fn)
+
+    def ret(a, b):
+        if a.shape != b.shape:
+            c_shape = shape_broadcast(a.shape, b.shape)
+        else:
+            c_shape = a.shape
+        dtype = promote_types(a.dtype, b.dtype) if out_dtype is None else out_dtype
+        out = a.empty(c_shape, dtype)
+        f(*out.tuple(), *a.tuple(), *b.tuple())
+        return out
+
+    return ret
+
+
+def tensor_reduce(fn):
+    """
+    Higher-order tensor reduce function.
+
+    Args:
+        fn: reduction function mapping two floats to float.
+        out (array): storage for `out` tensor.
+        out_shape (array): shape for `out` tensor.
+        out_strides (array): strides for `out` tensor.
+        a_storage (array): storage for `a` tensor.
+        a_shape (array): shape for `a` tensor.
+        a_strides (array): strides for `a` tensor.
+        reduce_shape (array): shape of reduction (1 for dimension kept, shape value for dimensions summed out)
+        reduce_size (int): size of reduce shape
+
+    Returns:
+       None : Fills in `out`.
+    """
+    combine = vectorize(fn, 2)
+    if fn in REDUCERS:
+        ufunc = REDUCERS[fn]
+    else:
+        ufunc = np.frompyfunc(fn, 2, 1)
+
+    def _reduce(
+        out, out_shape, out_strides, a, a_shape, a_strides, reduce_shape, reduce_size
+    ):
+        axes = tuple(i for i, s in enumerate(reduce_shape) if s != 1)
+        out_view = strided_view(out, out_shape, out_strides)
+        reduced = strided_view(a, a_shape, a_strides)
+        with np.errstate(all="ignore"):
+            if fn in REDUCERS:
+                reduced = ufunc.reduce(reduced, axis=axes, keepdims=True)
+            else:
+                # Object ufuncs can only reduce one axis at a time.
+                for axis in axes:
+                    reduced = ufunc.reduce(reduced, axis=axis, keepdims=True)
+            combine(out_view, reduced.reshape(out_view.shape), out=out_view)
+
+    return _reduce
+
+
+def reduce(fn, start=0.0):
+    """
+    Higher-order tensor reduce function.
+
+    Args:
+        fn: function from two floats-to-float to apply.
+        a (:class:`TensorData`): tensor to reduce over
+        dims (list, optional): list of dims to reduce
+        out (:class:`TensorData`, optional): tensor to reduce into
+
+    Returns:
+       :class:`TensorData` : new tensor data
+    """
+
+    f = tensor_reduce(fn)
+
+    def ret(a, dims=None, out=None):
+        if out is None:
+            out_shape = list(a.shape)
+            for d in dims:
+                out_shape[d] = 1
+            # Other values when not sum.
+            out = a.empty(tuple(out_shape), float_dtype(a.dtype))
+            out._tensor._storage[:] = start
+
+        diff = len(a.shape) - len(out.shape)
+
+        reduce_shape = []
+        reduce_size = 1
+        for i, s in enumerate(a.shape):
+            if i < diff or out.shape[i - diff] == 1:
+                reduce_shape.append(s)
+                reduce_size *= s
+            else:
+                reduce_shape.append(1)
+        f(*out.tuple(), *a.tuple(), reduce_shape, reduce_size)
+        return out
+
+    return ret
+
+
+class NumpyOps:
+    map = map
+    zip = zip
+    reduce = reduce
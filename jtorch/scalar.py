@@ -49,6 +49,8 @@ class Scalar(Variable):
 
     """
 
+    __slots__ = ("data",)
+
     def __init__(self, v, back=History(), name=None):
         super().__init__(back, name=name)
         self.data = v
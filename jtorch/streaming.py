@@ -0,0 +1,165 @@
+"""
+Out-of-core execution.
+
+The backends' `map` and `reduce` read the whole input and write the whole
+output in one call. The functions here run the same kernels over bounded
+chunks of rows (slices along the outermost dimension) instead, so a tensor
+mapped from a file much larger than memory (see :func:`jtorch.from_file`)
+can be reduced or transformed with a fixed footprint:
+
+* reductions accumulate each chunk into the same small output, since the
+  reduce kernels start from the values already in `out`;
+* maps write each chunk straight into the matching rows of the
+  destination, which can itself be a mapped file.
+
+Chunks of contiguous inputs are views of the mapping, only non-contiguous
+inputs are copied, one chunk at a time. Mapped pages are backed by the file,
+so the ones already processed can be reclaimed by the OS.
+"""
+
+import numpy as np
+from .numpy_ops import strided_view
+from .tensor import Tensor, from_file
+from .tensor_data import float_dtype
+from . import operators
+
+# Default bound on the bytes of input processed at once.
+MAX_CHUNK_BYTES = 64 << 20
+
+_kernels = {}
+
+
+def _kernel(kind, backend, fn, arg):
+    key = (kind, backend, fn, arg)
+    if key not in _kernels:
+        _kernels[key] = getattr(backend, kind)(fn, arg)
+    return _kernels[key]
+
+
+def chunks(a, max_bytes=None):
+    """
+    Split the rows of `a` into chunks of at most `max_bytes` of input.
+
+    A single row bigger than `max_bytes` is still one chunk.
+
+    Args:
+        a (:class:`Tensor`): tensor with at least one dimension.
+        max_bytes (int, optional): bound per chunk, :data:`MAX_CHUNK_BYTES`
+            if not given.
+
+    Returns:
+        list of (int, int) : [start, end) row ranges covering `a`.
+    """
+    max_bytes = MAX_CHUNK_BYTES if max_bytes is None else max_bytes
+    row_bytes = a.size // a.shape[0] * a.dtype.itemsize or 1
+    rows = max_bytes // row_bytes or 1
+    return [(s, min(s + rows, a.shape[0])) for s in range(0, a.shape[0], rows)]
+
+
+def _rows(a, start, end):
+    "Rows [start, end) of `a` as a contiguous tensor, a view when possible."
+    storage, shape, strides = a.tuple()
+    view = strided_view(storage, shape, strides)[start:end]
+    return Tensor.make(np.ascontiguousarray(view).reshape(-1), view.shape, backend=a.tf)
+
+
+def _out_rows(out, start, end):
+    "Rows [start, end) of the contiguous `out`, sharing its storage."
+    storage, shape, _ = out.tuple()
+    row = out.size // shape[0]
+    rows = storage[start * row : end * row]
+    return Tensor.make(rows, (end - start,) + tuple(shape[1:]), backend=out.tf)
+
+
+def _flush(out):
+    "Write back the dirty pages of a file-backed output."
+    storage = out._tensor._storage
+    if isinstance(storage, np.memmap):
+        storage.flush()
+
+
+def reduce(fn, a, dim=None, start=0.0, max_bytes=None):
+    """
+    Reduce `a` with `fn` one chunk of rows at a time.
+
+    Args:
+        fn: reduction function mapping two floats to float, e.g.
+            :func:`operators.add`.
+        a (:class:`Tensor`): tensor to reduce, typically from
+            :func:`jtorch.from_file`.
+        dim (int, optional): dimension to reduce, all of them if not given.
+        start (float): initial value of the reduction.
+        max_bytes (int, optional): bound on the input per chunk.
+
+    Returns:
+        :class:`Tensor` : `dim` reduced to size 1, or shape (1,) if `dim` is
+        not given.
+    """
+    f = _kernel("reduce", a.tf._backend, fn, start)
+    dtype = float_dtype(a.dtype)
+    if dim is not None:
+        assert -a.dims <= dim < a.dims, f"dim {dim} out of range for {a.shape}"
+        dim = dim % a.dims
+    if dim is None:
+        out_shape = (1,)
+    else:
+        out_shape = tuple(1 if d == dim else s for d, s in enumerate(a.shape))
+    storage = np.empty(int(np.prod(out_shape)), dtype)
+    storage[:] = start
+    out = Tensor.make(storage, out_shape, backend=a.tf)
+
+    for lo, hi in chunks(a, max_bytes):
+        rows = _rows(a, lo, hi)
+        if dim is None:
+            # Partial results of every chunk accumulate in the single value.
+            f(rows.view(rows.size), [0], out=out)
+        elif dim == 0:
+            f(rows, [0], out=out)
+        else:
+            f(rows, [dim], out=_out_rows(out, lo, hi))
+    return out
+
+
+def map(fn, a, out=None, max_bytes=None):
+    """
+    Apply `fn` elementwise one chunk of rows at a time.
+
+    Args:
+        fn: function from float to float.
+        a (:class:`Tensor`): input tensor.
+        out (:class:`Tensor` or path, optional): contiguous destination of the
+            shape of `a`, or the path of a `.npy` file to create for it. A new
+            in-memory tensor if not given.
+        max_bytes (int, optional): bound on the input per chunk.
+
+    Returns:
+        :class:`Tensor` : `out`.
+    """
+    f = _kernel("map", a.tf._backend, fn, False)
+    if out is None:
+        out = a.empty()
+    elif not isinstance(out, Tensor):
+        out = from_file(out, "w+", a.shape, a.dtype, backend=a.tf)
+    assert out.shape == a.shape and out._tensor.is_contiguous()
+
+    for lo, hi in chunks(a, max_bytes):
+        f(_rows(a, lo, hi), out=_out_rows(out, lo, hi))
+        _flush(out)
+    return out
+
+
+def sum(a, dim=None, max_bytes=None):
+    "Streaming sum, see :func:`reduce`."
+    return reduce(operators.add, a, dim, 0.0, max_bytes)
+
+
+def mean(a, dim=None, max_bytes=None):
+    "Streaming mean, see :func:`reduce`."
+    out = sum(a, dim, max_bytes)
+    out._tensor._storage /= a.size if dim is None else a.shape[dim]
+    return out
+
+
+def max(a, dim=None, max_bytes=None):
+    "Streaming maximum, see :func:`reduce`."
+    return reduce(operators.max, a, dim, -np.inf, max_bytes)
@@ -6,36 +6,155 @@ from .autodiff import FunctionBase, Variable
 from . import operators
 import random
 from .tensor_ops import TensorOps
-from .tensor_data import TensorData
+from .tensor_data import TensorData, float_dtype, scalar_dtype
+from .fusion import LazyData, fused_map, fused_zip
+from .mask import GT, compare, select
+from .allocator import default_allocator
+from .generator import default_generator
+from .numpy_ops import strided_view
 import numpy as np
 
 
 # Construction
-def zeros(shape):
-    return Tensor.make([0] * int(operators.prod(shape)), shape)
+def zeros(shape, dtype=np.float64, backend=None):
+    """
+    Produce a tensor of size `shape` filled with 0.
 
+    Args:
+       shape (tuple): shape of tensor.
+       dtype (dtype): element type.
+       backend (optional): tensor functions of the new tensor.
 
-def rand(shape):
+    Returns:
+       :class:`Tensor` : New tensor
     """
-    Produce a random tensor of size `shape`.
+    storage = default_allocator.zeros(int(operators.prod(shape)), dtype)
+    return Tensor.make(storage, shape, backend=backend)
+
+
+def empty(shape, dtype=np.float64, backend=None):
+    """
+    Produce a tensor of size `shape` without initializing its values. Only
+    for outputs that are about to be overwritten in full.
 
     Args:
        shape (tuple): shape of tensor.
+       dtype (dtype): element type.
+       backend (optional): tensor functions of the new tensor.
 
     Returns:
        :class:`Tensor` : New tensor
     """
-    vals = [random.random() for _ in range(int(operators.prod(shape)))]
-    return Tensor.make(vals, shape)
+    storage = default_allocator.empty(int(operators.prod(shape)), dtype)
+    return Tensor.make(storage, shape, backend=backend)
 
 
-def tensor(ls, shape=None):
+def full(shape, value, dtype=np.float64, backend=None):
+    """
+    Produce a tensor of size `shape` filled with `value`.
+
+    Args:
+       shape (tuple): shape of tensor.
+       value (float): fill value.
+       dtype (dtype): element type.
+       backend (optional): tensor functions of the new tensor.
+
+    Returns:
+       :class:`Tensor` : New tensor
+    """
+    storage = default_allocator.empty(int(operators.prod(shape)), dtype)
+    storage.fill(value)
+    return Tensor.make(storage, shape, backend=backend)
+
+
+def zeros_like(t):
+    """
+    Produce a tensor of 0s with the shape, type and backend of `t`.
+
+    Args:
+       t (:class:`Tensor`): tensor to mimic.
+
+    Returns:
+       :class:`Tensor` : New tensor
+    """
+    return t.zeros()
+
+
+def rand(shape, generator=None, dtype=np.float64, backend=None):
+    """
+    Produce a random tensor of size `shape` with values in U[0, 1).
+
+    Args:
+       shape (tuple): shape of tensor.
+       generator (:class:`Generator`, optional): source of randomness,
+           :data:`default_generator` if not given.
+       dtype (dtype): float32 or float64.
+       backend (optional): tensor functions of the new tensor.
+
+    Returns:
+       :class:`Tensor` : New tensor
+    """
+    generator = default_generator if generator is None else generator
+    storage = default_allocator.empty(int(operators.prod(shape)), dtype)
+    vals = generator.uniform(storage)
+    return Tensor.make(vals, shape, backend=backend)
+
+
+def randn(shape, generator=None, dtype=np.float64, backend=None):
+    """
+    Produce a random tensor of size `shape` with values in N(0, 1).
+
+    Args:
+       shape (tuple): shape of tensor.
+       generator (:class:`Generator`, optional): source of randomness,
+           :data:`default_generator` if not given.
+       dtype (dtype): float32 or float64.
+       backend (optional): tensor functions of the new tensor.
+
+    Returns:
+       :class:`Tensor` : New tensor
+    """
+    generator = default_generator if generator is None else generator
+    storage = default_allocator.empty(int(operators.prod(shape)), dtype)
+    vals = generator.normal(storage)
+    return Tensor.make(vals, shape, backend=backend)
+
+
+def from_file(path, mode="r", shape=None, dtype=np.float64, backend=None):
+    """
+    Produce a tensor whose storage is a memory mapping of a `.npy` file.
+
+    Nothing is read up front: pages are loaded as kernels touch them and
+    are shared with every other process mapping the same file.
+
+    Args:
+       path (str): `.npy` file, e.g. written by :meth:`Tensor.save`.
+       mode (str): "r" read-only, "r+" writes go to the file, "c" writes
+           stay in memory, "w+" creates a new file of `shape` and `dtype`.
+       shape (tuple, optional): shape of a new file (mode "w+").
+       dtype (dtype): element type of a new file (mode "w+").
+       backend (optional): tensor functions of the new tensor.
+
+    Returns:
+       :class:`Tensor` : New tensor
+    """
+    if mode == "w+":
+        mapped = np.lib.format.open_memmap(path, mode, dtype, tuple(shape))
+    else:
+        mapped = np.lib.format.open_memmap(path, mode)
+    # Fortran-ordered files map as column-major strides over the same pages.
+    storage = mapped.reshape(-1, order="A")
+    strides = tuple(s // mapped.itemsize for s in mapped.strides)
+    return Tensor.make(storage, mapped.shape, strides, backend=backend)
+
+
+def tensor(ls, shape=None, dtype=None):
     if not shape:
         shape = (len(ls),)
-    return Tensor.make(ls, shape)
+    return Tensor.make(ls, shape, dtype=dtype)
 
 
-def tensor_fromlist(ls):
+def tensor_fromlist(ls, dtype=None):
     def shape(ls):
         if isinstance(ls, (list, tuple)):
             return [len(ls)] + shape(ls[0])
@@ -50,13 +169,15 @@ def tensor_fromlist(ls):
 
     cur = flatten(ls)
     shape = shape(ls)
-    return tensor(cur, tuple(shape))
+    return tensor(cur, tuple(shape), dtype)
 
 
 # Tensor class
 class Tensor(Variable):
+    __slots__ = ("_tensor", "tf")
+
     def __init__(self, v, back=None, name=None, backend=None):
-        assert isinstance(v, TensorData)
+        assert isinstance(v, (TensorData, LazyData))
         super().__init__(back, name=name)
         self._tensor = v
         self.tf = backend
@@ -67,8 +188,8 @@ class Tensor(Variable):
         return Tensor(tensor_data, backend=self.tf)
 
     @staticmethod
-    def make(storage, shape, strides=None, backend=None):
-        return Tensor(TensorData(storage, shape, strides), backend=backend)
+    def make(storage, shape, strides=None, backend=None, dtype=None):
+        return Tensor(TensorData(storage, shape, strides, dtype), backend=backend)
 
     def type_(self, tf):
         self.tf = tf
@@ -88,15 +209,29 @@ class Tensor(Variable):
     def dims(self):
         return self._tensor.dims
 
+    @property
+    def dtype(self):
+        return self._tensor.dtype
+
     def to_numpy(self):
         return self.contiguous()._tensor._storage.reshape(self.shape)
 
     def contiguous(self):
         return self.tf.Copy.apply(self)
 
+    def save(self, path):
+        """
+        Write the values to a `.npy` file, readable by :func:`from_file`
+        and :func:`numpy.load`.
+
+        Args:
+           path (str): file to write.
+        """
+        np.save(path, self.to_numpy(), allow_pickle=False)
+
     def ensure_tensor(self, b):
         if isinstance(b, (int, float)):
-            b = tensor([b])
+            b = tensor([b], dtype=scalar_dtype(self.dtype, b))
         b.type_(self.tf)
         return b
 
@@ -137,6 +272,10 @@ class Tensor(Variable):
     def exp(self):
         return self.tf.Exp.apply(self)
 
+    def astype(self, dtype):
+        "Copy with elements converted to `dtype`, gradients are converted back."
+        return self.tf.Cast.apply(self, np.dtype(dtype))
+
     def sum(self, dim=None):
         return self.tf.Sum.apply(self, dim)
 
@@ -168,38 +307,89 @@ class Tensor(Variable):
             return other
 
         shape = TensorData.shape_broadcast(self.shape, other.shape)
-        buf = zeros(shape)
+        buf = empty(shape, other.dtype)
         self.tf._id_map(other, out=buf)
         if self.shape == shape:
             return buf
 
-        buf2 = zeros(self.shape)
+        buf2 = zeros(self.shape, other.dtype)
         self.tf._add_reduce(buf, out=buf2)
         return buf2
 
     # Internal
-    def zeros(self, shape=None):
+    def zeros(self, shape=None, dtype=None):
+        out = zeros(
+            self.shape if shape is None else shape,
+            self.dtype if dtype is None else dtype,
+        )
+        out.type_(self.tf)
+        return out
 
-        if shape is None:
-            out = zeros(self.shape)
-        else:
-            out = zeros(shape)
+    def empty(self, shape=None, dtype=None):
+        "Uninitialized tensor on the same backend, see :func:`empty`."
+        out = empty(
+            self.shape if shape is None else shape,
+            self.dtype if dtype is None else dtype,
+        )
         out.type_(self.tf)
         return out
 
     def tuple(self):
         return self._tensor.tuple()
 
+    def _fill_(self, sample):
+        data = self._tensor
+        data._prepare_write()
+        if data.is_contiguous():
+            sample(data._storage)
+        else:
+            strided_view(data._storage, data.shape, data.strides)[...] = sample(
+                np.empty(data.shape, data.dtype)
+            )
+        return self
+
+    def uniform_(self, low=0.0, high=1.0, generator=None):
+        """
+        Fill in place with values in U[low, high).
+
+        Args:
+           low (float): lower bound.
+           high (float): upper bound (excluded).
+           generator (:class:`Generator`, optional): source of randomness,
+               :data:`default_generator` if not given.
+
+        Returns:
+           :class:`Tensor` : self
+        """
+        generator = default_generator if generator is None else generator
+        return self._fill_(lambda out: generator.uniform(out, low, high))
+
+    def normal_(self, mean=0.0, std=1.0, generator=None):
+        """
+        Fill in place with values in N(mean, std^2).
+
+        Args:
+           mean (float): mean.
+           std (float): standard deviation.
+           generator (:class:`Generator`, optional): source of randomness,
+               :data:`default_generator` if not given.
+
+        Returns:
+           :class:`Tensor` : self
+        """
+        generator = default_generator if generator is None else generator
+        return self._fill_(lambda out: generator.normal(out, mean, std))
+
     # Extra
     def get_data(self):
         return Tensor(self._tensor, backend=self.tf)
 
-    def backward(self, grad_output=None):
+    def backward(self, grad_output=None, retain_graph=False):
         if grad_output is None:
             assert self.shape == (1,), "Must provide grad_output if non-scalar"
-            grad_output = tensor([1.0])
+            grad_output = tensor([1.0], dtype=float_dtype(self.dtype))
             grad_output.tf = self.tf
-        super().backward(grad_output)
+        super().backward(grad_output, retain_graph)
 
 
 # Constructors
@@ -217,25 +407,51 @@ class Function(FunctionBase):
         return (a._tensor, a.tf)
 
 
-def make_tensor_functions(backend):
-    neg_map = backend.map(operators.neg)
-    sigmoid_map = backend.map(operators.sigmoid)
-    relu_map = backend.map(operators.relu)
-    log_map = backend.map(operators.log)
-    exp_map = backend.map(operators.exp)
-    id_map = backend.map(operators.id)
-    inv_map = backend.map(operators.inv)
+def make_tensor_functions(backend, fuse=False):
+    """
+    Build the autodiff functions for a backend.
+
+    Args:
+        backend: tensor ops class with `map`, `zip` and `reduce`.
+        fuse (bool): record elementwise ops lazily and compile chains of them
+            into single kernels (see :mod:`jtorch.fusion`).
+
+    Returns:
+        class : container of :class:`Function` classes.
+    """
 
-    add_zip = backend.zip(operators.add)
-    mul_zip = backend.zip(operators.mul)
-    lt_zip = backend.zip(operators.lt)
-    eq_zip = backend.zip(operators.eq)
-    relu_back_zip = backend.zip(operators.relu_back)
-    log_back_zip = backend.zip(operators.log_back)
-    inv_back_zip = backend.zip(operators.inv_back)
+    def _map(fn, floating=False):
+        if fuse:
+            return fused_map(fn, backend.map(fn, floating), floating)
+        return backend.map(fn, floating)
+
+    def _zip(fn, out_dtype=None):
+        if fuse:
+            return fused_zip(fn, out_dtype)
+        return backend.zip(fn, out_dtype)
+
+    neg_map = _map(operators.neg)
+    sigmoid_map = _map(operators.sigmoid, floating=True)
+    relu_map = _map(operators.relu)
+    log_map = _map(operators.log, floating=True)
+    exp_map = _map(operators.exp, floating=True)
+    id_map = _map(operators.id)
+    inv_map = _map(operators.inv, floating=True)
+
+    add_zip = _zip(operators.add)
+    mul_zip = _zip(operators.mul)
+    lt_zip = _zip(operators.lt, np.bool_)
+    eq_zip = _zip(operators.eq, np.bool_)
+    relu_back_zip = _zip(operators.relu_back)
+    log_back_zip = _zip(operators.log_back)
+    inv_back_zip = _zip(operators.inv_back)
 
     add_reduce = backend.reduce(operators.add)
 
+    # Saved masks are bit-packed by CPU kernels. Fused graphs keep the lazy
+    # input instead so it is not materialized just for the mask.
+    packed_masks = not fuse and "Cuda" not in str(backend)
+
     class TF:
         _add_reduce = add_reduce
         _id_map = id_map
@@ -250,6 +466,17 @@ def make_tensor_functions(backend):
             def backward(ctx, grad_output):
                 return neg_map(grad_output)
 
+        class Cast(Function):
+            @staticmethod
+            def forward(ctx, t1, dtype):
+                ctx.save_for_backward(t1.dtype)
+                return id_map(t1, out=t1.empty(dtype=dtype))
+
+            @staticmethod
+            def backward(ctx, grad_output):
+                dtype = ctx.saved_values
+                return id_map(grad_output, out=grad_output.empty(dtype=dtype)), None
+
         class Inv(Function):
             @staticmethod
             def forward(ctx, t1):
@@ -305,7 +532,9 @@ def make_tensor_functions(backend):
             @staticmethod
             def forward(ctx, a):
                 # ASSIGN2.2
-                ctx.save_for_backward(a)
+                # Only the sign of the input is needed for backward.
+                if not ctx.no_grad:
+                    ctx.save_for_backward(compare(a, 0.0, GT) if packed_masks else a)
                 return relu_map(a)
                 # END ASSIGN2.2
 
@@ -313,6 +542,8 @@ def make_tensor_functions(backend):
             def backward(ctx, grad_output):
                 # ASSIGN2.3
                 a = ctx.saved_values
+                if packed_masks:
+                    return select(a, grad_output, 0.0)
                 return relu_back_zip(a, grad_output)
                 # END ASSIGN2.3
 
@@ -393,7 +624,7 @@ def make_tensor_functions(backend):
             def backward(ctx, grad_output):
                 # ASSIGN2.3
                 a_shape, b_shape = ctx.saved_values
-                return zeros(a_shape), zeros(b_shape)
+                return grad_output.zeros(a_shape), grad_output.zeros(b_shape)
                 # END ASSIGN2.3
 
         class EQ(Function):
@@ -408,7 +639,7 @@ def make_tensor_functions(backend):
             def backward(ctx, grad_output):
                 # ASSIGN2.3
                 a_shape, b_shape = ctx.saved_values
-                return zeros(a_shape), zeros(b_shape)
+                return grad_output.zeros(a_shape), grad_output.zeros(b_shape)
                 # END ASSIGN2.3
 
         class Permute(Function):
@@ -476,6 +707,7 @@ def grad_check(f, *vals):
         x.requires_grad_(True)
         x.zero_grad_()
     random.seed(10)
+    default_generator.manual_seed(10)
     out = f(*vals)
     out.sum().backward()
 
@@ -1,6 +1,7 @@
 import random
 from .operators import prod
 from numpy import array, float64, ndarray
+import numpy as np
 import numba
 
 MAX_DIMS = 32
@@ -8,6 +9,7 @@ MAX_DIMS = 32
 
 class IndexingError(RuntimeError):
     "Exception raised for indexing errors."
+
     pass
 
 
@@ -116,6 +118,151 @@ def shape_broadcast(shape1, shape2):
     # END ASSIGN2.4
 
 
+def broadcast_strides(out_shape, in_shape, in_strides):
+    """
+    Strides for walking a broadcast input with an index into `out_shape`.
+
+    Dimensions that are broadcast (size 1 or missing) get stride 0, so the
+    same input position is revisited instead of moving.
+
+    Args:
+       out_shape (array-like): shape being iterated
+       in_shape (array-like): shape of the input, broadcastable to `out_shape`
+       in_strides (array-like): strides of the input
+
+    Returns:
+       array : strides with one entry per dimension of `out_shape`.
+    """
+    strides = np.zeros(len(out_shape), np.int64)
+    diff = len(out_shape) - len(in_shape)
+    for i in range(len(in_shape)):
+        if in_shape[i] != 1:
+            strides[i + diff] = in_strides[i]
+    return strides
+
+
+def coalesce_dims(shape, strides, kinds=None):
+    """
+    Simplify an iteration space shared by several operands.
+
+    Size-1 dimensions are dropped and neighbouring dimensions are merged
+    whenever every operand can walk both of them as one longer dimension,
+    i.e. `stride[d] == stride[d + 1] * shape[d + 1]`. A broadcast operand has
+    stride 0 on both and always merges.
+
+    For example a contiguous (4, 5, 6) tensor plus a scalar becomes a single
+    dimension of 120 with strides (1, 0), and a (batch, 1, n) x (1, n, m)
+    product keeps only the dimensions where the broadcast pattern changes.
+
+    Args:
+       shape (array-like): shape being iterated
+       strides (list of array-like): per-operand strides aligned to `shape`
+           (see :func:`broadcast_strides`)
+       kinds (array-like, optional): a label per dimension, only dimensions
+           with the same label are merged (e.g. reduced vs kept).
+
+    Returns:
+       (tuple, list of tuple, tuple) : new shape, new strides per operand and
+       new labels. There is always at least one dimension.
+    """
+    if kinds is None:
+        kinds = [0] * len(shape)
+    new_shape = []
+    new_strides = [[] for _ in strides]
+    new_kinds = []
+    for d in range(len(shape)):
+        size = int(shape[d])
+        if size == 1:
+            continue
+        if (
+            new_shape
+            and new_kinds[-1] == kinds[d]
+            and all(s[-1] == int(st[d]) * size for st, s in zip(strides, new_strides))
+        ):
+            new_shape[-1] *= size
+            for st, s in zip(strides, new_strides):
+                s[-1] = int(st[d])
+            continue
+        new_shape.append(size)
+        new_kinds.append(kinds[d])
+        for st, s in zip(strides, new_strides):
+            s.append(int(st[d]))
+    if not new_shape:
+        new_shape = [1]
+        new_kinds = [kinds[-1] if len(kinds) else 0]
+        new_strides = [[0] for _ in strides]
+    return (
+        tuple(new_shape),
+        [tuple(s) for s in new_strides],
+        tuple(new_kinds),
+    )
+
+
+def reduce_dims(out_shape, out_strides, a_shape, a_strides):
+    """
+    Coalesced iteration space for reducing `a` into `out`.
+
+    Dimensions that are summed out (missing or size 1 in `out`) are labelled
+    1, kept dimensions are labelled 0. Only dimensions with the same label
+    are merged, so a reduction over the last contiguous axis of a matrix (or
+    any tensor) becomes `(kept, reduced)`.
+
+    Returns:
+       (tuple, list of tuple, tuple) : see :func:`coalesce_dims`, operands
+       are `(out, a)`.
+    """
+    diff = len(a_shape) - len(out_shape)
+    kinds = [
+        1 if i < diff or out_shape[i - diff] == 1 else 0 for i in range(len(a_shape))
+    ]
+    out_aligned = broadcast_strides(a_shape, out_shape, out_strides)
+    return coalesce_dims(a_shape, [out_aligned, a_strides], kinds)
+
+
+def float_dtype(dtype):
+    """
+    Result type of a floating-point function (e.g. `exp`, a mean) of `dtype`.
+
+    Returns:
+       dtype : `dtype` itself if it is a float type, float64 otherwise.
+    """
+    dtype = np.dtype(dtype)
+    return dtype if dtype.kind == "f" else np.dtype(float64)
+
+
+def promote_types(dtype1, dtype2):
+    """
+    Result type of an elementwise operation on two tensors, as in NumPy
+    (e.g. float32 with float64 gives float64, int32 with float32 gives
+    float64, bool with anything gives the other type).
+    """
+    return np.promote_types(dtype1, dtype2)
+
+
+def scalar_dtype(dtype, value):
+    """
+    Type given to a Python scalar combined with a tensor of `dtype`.
+
+    Scalars are weakly typed: they take the type of the tensor when they are
+    of the same kind, so `x * 2.0` stays float32 for a float32 `x`. A float
+    scalar with an integer or bool tensor is float64, an int scalar with a
+    bool tensor is int64.
+
+    Args:
+       dtype (dtype): type of the tensor.
+       value (int or float): the scalar.
+
+    Returns:
+       dtype : type of the scalar tensor.
+    """
+    dtype = np.dtype(dtype)
+    if isinstance(value, bool):
+        return dtype
+    if isinstance(value, int):
+        return dtype if dtype.kind in "iuf" else np.dtype(np.int64)
+    return float_dtype(dtype)
+
+
 def strides_from_shape(shape):
     """Calculates strides of a tensor from shape attribute.
 
@@ -141,6 +288,12 @@ def strides_from_shape(shape):
     return tuple(reversed(layout[:-1]))
 
 
+# Fused results not computed yet (see `jtorch.fusion`), by id of a storage
+# they read. Every view of a storage shares its entry, so a write through any
+# of them computes the results first.
+pending_reads = {}
+
+
 class TensorData:
     """Contigious data abstraction for a tensor
 
@@ -178,11 +331,13 @@ class TensorData:
 
     """
 
-    def __init__(self, storage, shape, strides=None):
+    def __init__(self, storage, shape, strides=None, dtype=None):
         if isinstance(storage, ndarray):
             self._storage = storage
+            if dtype is not None:
+                self._storage = storage.astype(dtype, copy=False)
         else:
-            self._storage = array(storage, dtype=float64)
+            self._storage = array(storage, dtype=float64 if dtype is None else dtype)
 
         if strides is None:
             strides = strides_from_shape(shape)
@@ -197,8 +352,16 @@ class TensorData:
         self.dims = len(strides)
         self.size = int(prod(shape))
         self.shape = shape
+        # Bumped on every write through `set`, so caches derived from the
+        # values (e.g. transformed conv filters) can tell they are stale.
+        self._version = 0
         assert len(self._storage) == self.size
 
+    @property
+    def dtype(self):
+        "Element type of the storage (float32, float64, int32, int64, bool, uint8)."
+        return self._storage.dtype
+
     def to_cuda_(self):
         if not numba.cuda.is_cuda_array(self._storage):
             self._storage = numba.cuda.to_device(self._storage)
@@ -248,8 +411,17 @@ class TensorData:
         return self._storage[self.index(key)]
 
     def set(self, key, val):
+        self._prepare_write()
         self._storage[self.index(key)] = val
 
+    def _prepare_write(self):
+        "Compute pending fused results reading the old values and bump `_version`."
+        pending = pending_reads.pop(id(self._storage), None)
+        if pending:
+            for lazy in list(pending):
+                lazy.materialize()
+        self._version += 1
+
     def tuple(self):
         return (self._storage, self._shape, self._strides)
 
@@ -4,8 +4,14 @@ from .tensor_data import (
     index_to_position,
     broadcast_index,
     shape_broadcast,
+    broadcast_strides,
+    coalesce_dims,
+    reduce_dims,
+    float_dtype,
+    promote_types,
     MAX_DIMS,
 )
+from .operators import prod
 
 
 def tensor_map(fn):
@@ -40,12 +46,14 @@ def tensor_map(fn):
     return _map
 
 
-def map(fn):
+def map(fn, floating=False):
     """
     Higher-order tensor map function.
 
     Args:
         fn: function from float-to-float to apply.
+        floating (bool): the result is floating point whatever the input
+            (see :func:`float_dtype`), otherwise it has the type of `a`.
         a (:class:`TensorData`): tensor to map over
         out (:class:`TensorData`): optional, tensor data to fill in,
         should broadcast with `a`.
@@ -57,8 +65,15 @@ def map(fn):
 
     def ret(a, out=None):
         if out is None:
-            out = a.zeros(a.shape)
-        f(*out.tuple(), *a.tuple())
+            out = a.empty(dtype=float_dtype(a.dtype) if floating else a.dtype)
+        out_storage, out_shape, out_strides = out.tuple()
+        in_storage, in_shape, in_strides = a.tuple()
+        shape, (o_st, i_st), _ = coalesce_dims(
+            out_shape,
+            [out_strides, broadcast_strides(out_shape, in_shape, in_strides)],
+        )
+        shape = np.array(shape)
+        f(out_storage, shape, np.array(o_st), in_storage, shape, np.array(i_st))
         return out
 
     return ret
@@ -102,12 +117,14 @@ def tensor_zip(fn):
     return _zip
 
 
-def zip(fn):
+def zip(fn, out_dtype=None):
     """
     Higher-order tensor zip function.
 
     Args:
         fn: function from two floats-to-float to apply.
+        out_dtype (dtype, optional): type of the result (e.g. bool for
+            comparisons), promoted from `a` and `b` if not given.
         a (:class:`TensorData`): tensor to zip over
         b (:class:`TensorData`): tensor to zip over
     Returns:
@@ -121,8 +138,31 @@ def zip(fn):
             c_shape = shape_broadcast(a.shape, b.shape)
         else:
             c_shape = a.shape
-        out = a.zeros(c_shape)
-        f(*out.tuple(), *a.tuple(), *b.tuple())
+        dtype = promote_types(a.dtype, b.dtype) if out_dtype is None else out_dtype
+        out = a.empty(c_shape, dtype)
+        out_storage, out_shape, out_strides = out.tuple()
+        a_storage, a_shape, a_strides = a.tuple()
+        b_storage, b_shape, b_strides = b.tuple()
+        shape, (o_st, a_st, b_st), _ = coalesce_dims(
+            out_shape,
+            [
+                out_strides,
+                broadcast_strides(out_shape, a_shape, a_strides),
+                broadcast_strides(out_shape, b_shape, b_strides),
+            ],
+        )
+        shape = np.array(shape)
+        f(
+            out_storage,
+            shape,
+            np.array(o_st),
+            a_storage,
+            shape,
+            np.array(a_st),
+            b_storage,
+            shape,
+            np.array(b_st),
+        )
         return out
 
     return ret
@@ -191,21 +231,26 @@ def reduce(fn, start=0.0):
             for d in dims:
                 out_shape[d] = 1
             # Other values when not sum.
-            out = a.zeros(tuple(out_shape))
+            out = a.empty(tuple(out_shape), float_dtype(a.dtype))
             out._tensor._storage[:] = start
 
-        diff = len(a.shape) - len(out.shape)
-
-        reduce_shape = []
-        reduce_size = 1
-        for i, s in enumerate(a.shape):
-            if i < diff or out.shape[i - diff] == 1:
-                reduce_shape.append(s)
-                reduce_size *= s
-            else:
-                reduce_shape.append(1)
-        assert len(out.shape) == len(a.shape)
-        f(*out.tuple(), *a.tuple(), reduce_shape, reduce_size)
+        out_storage, out_shape, out_strides = out.tuple()
+        a_storage, a_shape, a_strides = a.tuple()
+        shape, (o_st, a_st), kinds = reduce_dims(
+            out_shape, out_strides, a_shape, a_strides
+        )
+        keep_shape = [1 if kinds[d] else s for d, s in enumerate(shape)]
+        reduce_shape = [s if kinds[d] else 1 for d, s in enumerate(shape)]
+        f(
+            out_storage,
+            keep_shape,
+            o_st,
+            a_storage,
+            shape,
+            a_st,
+            reduce_shape,
+            int(prod(reduce_shape)),
+        )
         return out
 
     return ret
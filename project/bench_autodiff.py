@@ -0,0 +1,57 @@
+"""
+Per-op overhead of the autodiff bookkeeping on the scalar engine: time to
+record and to backpropagate one op, and the bytes each node of a live graph
+keeps (the output Scalar, its History, Context and saved values).
+
+    python project/bench_autodiff.py
+"""
+
+import time
+import tracemalloc
+import jtorch
+
+OPS = 100000
+
+
+def chain(x, n):
+    "n ops, alternating between ones that save values and ones that do not."
+    y = x
+    for _ in range(n // 2):
+        y = (y * 0.999999) + 1e-6
+    return y
+
+
+def bench_forward(repeat=5):
+    x = jtorch.Scalar(1.0)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        chain(x, OPS)
+    return (time.perf_counter() - start) / (repeat * OPS) * 1e9
+
+
+def bench_backward(repeat=5):
+    total = 0.0
+    for _ in range(repeat):
+        x = jtorch.Scalar(1.0)
+        y = chain(x, OPS)
+        start = time.perf_counter()
+        y.backward()
+        total += time.perf_counter() - start
+    return total / (repeat * OPS) * 1e9
+
+
+def bytes_per_node():
+    x = jtorch.Scalar(1.0)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    y = chain(x, OPS)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del y
+    return (after - before) / OPS
+
+
+if __name__ == "__main__":
+    print(f"forward:  {bench_forward():8.0f} ns/op")
+    print(f"backward: {bench_backward():8.0f} ns/op")
+    print(f"graph:    {bytes_per_node():8.0f} bytes/node")
@@ -0,0 +1,60 @@
+"""
+Peak activation memory and step time of forward + backward through a deep
+stack of linear + ReLU layers, without checkpointing and with
+`checkpoint_sequential` at about sqrt(depth) segments. Memory is the peak
+of the caching allocator's buffers in use during the step.
+
+    python project/bench_checkpoint.py
+"""
+
+import time
+import jtorch
+
+BACKEND = jtorch.make_tensor_functions(jtorch.FastOps)
+BATCH = 64
+WIDTH = 256
+DEPTHS = [4, 16, 64]
+
+
+class Layer(jtorch.Module):
+    def __init__(self):
+        super().__init__()
+        w = jtorch.rand((WIDTH, WIDTH))
+        w.type_(BACKEND)
+        self.weights = jtorch.Parameter(0.1 * (w - 0.5))
+
+    def forward(self, x):
+        return jtorch.matmul(x, self.weights.value).relu()
+
+
+def step(layers, x, checkpoint):
+    if checkpoint:
+        out = jtorch.checkpoint_sequential(layers, x)
+    else:
+        out = x
+        for layer in layers:
+            out = layer(out)
+    out.sum().backward()
+
+
+def bench(layers, x, checkpoint, repeat=5):
+    step(layers, x, checkpoint)
+    jtorch.default_allocator.reset_stats()
+    base = jtorch.default_allocator.bytes_in_use
+    start = time.perf_counter()
+    for _ in range(repeat):
+        step(layers, x, checkpoint)
+    ms = (time.perf_counter() - start) / repeat * 1e3
+    return ms, (jtorch.default_allocator.peak - base) / 2**20
+
+
+if __name__ == "__main__":
+    for depth in DEPTHS:
+        layers = [Layer() for _ in range(depth)]
+        x = jtorch.rand((BATCH, WIDTH))
+        x.type_(BACKEND)
+        x.requires_grad_(True)
+        for checkpoint in [False, True]:
+            ms, mb = bench(layers, x, checkpoint)
+            name = "checkpoint" if checkpoint else "plain"
+            print(f"depth {depth:>3} {name:>10}: {ms:8.2f} ms/step {mb:8.2f} MB peak")
@@ -0,0 +1,62 @@
+"""
+Time forward + backward of the two convolutions in run_mnist's Network2,
+for each convolution algorithm, with the multiplies per output pixel and
+channel pair (9 for im2col, 16 per 2x2 tile = 4 for Winograd F(2x2, 3x3)).
+Large kernels compare im2col with FFT, whose cost does not grow with the
+kernel.
+
+    python project/bench_conv.py
+"""
+
+import time
+import jtorch
+
+BACKEND = jtorch.make_tensor_functions(jtorch.FastOps)
+BATCH = 16
+
+# (in_channels, out_channels, kernel, image size): the layers of Network2,
+# then wider layers where the channel sums dominate, then large kernels.
+LAYERS = [
+    (1, 4, 3, 28),
+    (4, 8, 3, 28),
+    (16, 16, 3, 28),
+    (32, 32, 3, 28),
+    (4, 8, 7, 28),
+    (4, 8, 11, 64),
+]
+
+
+def make(shape):
+    t = jtorch.rand(shape)
+    t.type_(BACKEND)
+    t.requires_grad_(True)
+    return t
+
+
+def bench(conv, x, w, repeat=20):
+    def step():
+        conv(x, w).sum().backward()
+
+    step()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        step()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+# Multiplies per output pixel per (in, out) channel pair.
+MULTIPLIES = {"im2col": lambda k: k * k, "winograd": lambda k: 16 / 4, "fft": None}
+
+
+if __name__ == "__main__":
+    for cin, cout, k, size in LAYERS:
+        x = make((BATCH, cin, size, size))
+        w = make((cout, cin, k, k))
+        for algo in ["im2col", "winograd"] if k == 3 else ["im2col", "fft"]:
+            ms = bench(lambda a, b: jtorch.conv2d(a, b, algo=algo), x, w)
+            mul = MULTIPLIES[algo]
+            mul = f"{mul(k):6.2f} mul/output" if mul else ""
+            print(
+                f"{cin:>2} -> {cout:>2} {k:>2}x{k:<2} on {size}x{size} {algo:>9}: "
+                f"{ms:8.2f} ms/step {mul}"
+            )
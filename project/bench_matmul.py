@@ -0,0 +1,54 @@
+"""
+GFLOP/s of `matrix_multiply` on the shapes used by `MMLinear` in run_mnist,
+including the transposed operands seen in the backward pass. "dispatch" is
+`matrix_multiply` itself (BLAS above `BLAS_MIN_WORK`), "tiled" always runs
+the Numba kernel.
+
+    python project/bench_matmul.py
+"""
+
+import time
+import jtorch
+from jtorch.functions import _matrix_multiply
+
+BATCH = 16
+
+# (batch, in, out) of the MMLinear layers in run_mnist.
+LAYERS = [(BATCH, 784, 20), (BATCH, 20, 20), (BATCH, 20, 1), (BATCH, 392, 64)]
+
+
+def tiled(a, b):
+    ls = list(a.shape)
+    ls[-1] = b.shape[-1]
+    out = a.zeros(tuple(ls))
+    _matrix_multiply(*out.tuple(), *a.tuple(), *b.tuple())
+    return out
+
+
+def bench(fn, a, b, repeat=200):
+    fn(a, b)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(a, b)
+    elapsed = (time.perf_counter() - start) / repeat
+    n, m, p = a.shape[-2], a.shape[-1], b.shape[-1]
+    return 2 * n * m * p / elapsed / 1e9
+
+
+def shapes(batch, n, m):
+    x = jtorch.rand((batch, n))
+    w = jtorch.rand((n, m))
+    g = jtorch.rand((batch, m))
+    yield "forward x @ w", x, w
+    yield "grad x  g @ w.T", g, w.permute(1, 0)
+    yield "grad w  x.T @ g", x.permute(1, 0), g
+
+
+if __name__ == "__main__":
+    print(f"{'shape':>18} {'op':>16} {'dispatch':>8} {'tiled':>8}  GFLOP/s")
+    for batch, n, m in LAYERS:
+        for name, a, b in shapes(batch, n, m):
+            blas = bench(jtorch.functions.matrix_multiply, a, b)
+            tile = bench(tiled, a, b)
+            shape = f"{a.shape[-2]}x{a.shape[-1]}x{b.shape[-1]}"
+            print(f"{shape:>18} {name:>16} {blas:8.2f} {tile:8.2f}")
@@ -1,17 +1,18 @@
+import os
 from mnist import MNIST
 import jtorch
 import visdom
 import numpy
 
 vis = visdom.Visdom()
-mndata = MNIST("data/")
-images, labels = mndata.load_training()
 
 
 BACKEND = jtorch.make_tensor_functions(jtorch.FastOps)
 RATE = 0.01
 HIDDEN = 20
 BATCH = 16
+# Activations and gradients are half the size of float64 ones.
+DTYPE = numpy.float32
 
 
 class Network(jtorch.Module):
@@ -33,36 +34,34 @@ class Network(jtorch.Module):
 class MMLinear(jtorch.Module):
     def __init__(self, in_size, out_size):
         super().__init__()
-        r = jtorch.rand((in_size, out_size))
+        r = jtorch.rand((in_size, out_size), dtype=DTYPE)
         r.type_(BACKEND)
         self.weights = jtorch.Parameter(0.1 * (r - 0.5))
-        r = jtorch.rand((out_size,))
+        r = jtorch.rand((out_size,), dtype=DTYPE)
         r.type_(BACKEND)
         self.bias = jtorch.Parameter(0.1 * (r - 0.5))
         self.out_size = out_size
 
     def forward(self, x):
         # ASSIGN3.5
-        batch, in_size = x.shape
-        return jtorch.matmul(
-            x.view(batch, 1, in_size),
-            self.weights.value.view(1, in_size, self.out_size),
-        ).view(batch, self.out_size) + self.bias.value.view(1, self.out_size)
+        return jtorch.matmul(x, self.weights.value) + self.bias.value.view(
+            1, self.out_size
+        )
         # END ASSIGN3.5
 
 
 class Conv2d(jtorch.Module):
     def __init__(self, in_channels, out_channels, kh, kw):
         super().__init__()
-        r = jtorch.rand((out_channels, in_channels, kh, kw))
+        r = jtorch.rand((out_channels, in_channels, kh, kw), dtype=DTYPE)
         r.type_(BACKEND)
         self.weights = jtorch.Parameter(0.1 * (r - 0.5))
-        r = jtorch.rand((out_channels, 1, 1))
+        r = jtorch.rand((out_channels, 1, 1), dtype=DTYPE)
         r.type_(BACKEND)
         self.bias = jtorch.Parameter(0.1 * (r - 0.5))
 
     def forward(self, input):
-        out = jtorch.Conv2dFun.apply(input, self.weights.value) + self.bias.value
+        out = jtorch.conv2d(input, self.weights.value) + self.bias.value
         return out
 
 
@@ -85,25 +84,29 @@ class Network2(jtorch.Module):
         self.out = x
         x = jtorch.avgpool2d(x, (4, 4))
         x = self.linear1(x.view(BATCH, 392)).relu()
-        x = self.linear2(x).sigmoid()
-        return x
-
-
-ys = []
-X = []
-for i in range(10000):
-    y = labels[i]
-    if y == 3 or y == 5:
-        ys.append(1.0 if y == 3 else 0.0)
-        X += images[i]
-
-val_ys = []
-val_x = []
-for i in range(10000, 10500):
-    y = labels[i]
-    if y == 3 or y == 5:
-        val_ys.append(1.0 if y == 3 else 0.0)
-        val_x += images[i]
+        # Logits, the sigmoid is folded into the loss.
+        return self.linear2(x)
+
+
+def load_3s_and_5s(name, start, end):
+    """
+    Flat images and labels (1.0 for a 3) of the 3s and 5s among training
+    examples [start, end). They are converted once to `data/<name>_*.npy`
+    and memory mapped from then on, so batches are slices of the file.
+    """
+    x_path, y_path = f"data/{name}_x.npy", f"data/{name}_y.npy"
+    if not os.path.exists(x_path):
+        images, labels = MNIST("data/").load_training()
+        keep = [i for i in range(start, end) if labels[i] in (3, 5)]
+        numpy.save(y_path, numpy.array([labels[i] == 3 for i in keep], DTYPE))
+        numpy.save(x_path, numpy.array([images[i] for i in keep], DTYPE).ravel())
+    X, _, _ = jtorch.from_file(x_path).tuple()
+    ys, _, _ = jtorch.from_file(y_path).tuple()
+    return X, ys
+
+
+X, ys = load_3s_and_5s("train_35", 0, 10000)
+val_x, val_ys = load_3s_and_5s("val_35", 10000, 10500)
 vis.images(
     numpy.array(val_x).reshape((len(val_ys), 1, 28, 28))[:BATCH], win="val_images"
 )
@@ -117,17 +120,16 @@ for epoch in range(250):
     for i, j in enumerate(range(0, len(ys), BATCH)):
         if len(ys) - j <= BATCH:
             continue
-        y = jtorch.tensor(ys[j : j + BATCH], (BATCH,))
-        x = jtorch.tensor(X[cur : cur + 28 * 28 * BATCH], (BATCH, 28 * 28))
+        y = jtorch.tensor(ys[j : j + BATCH], (BATCH,), DTYPE)
+        x = jtorch.tensor(X[cur : cur + 28 * 28 * BATCH], (BATCH, 28 * 28), DTYPE)
         x.requires_grad_(True)
         y.requires_grad_(True)
         y.type_(BACKEND)
         x.type_(BACKEND)
         # Forward
         out = model.forward(x.view(BATCH, 1, 28, 28)).view(BATCH)
-        prob = (out * y) + (out - 1.0) * (y - 1.0)
-        loss = -prob.log()
-        (loss.sum().view(1)).backward()
+        loss = jtorch.binary_cross_entropy_with_logits(out, y, "sum")
+        loss.backward()
         total_loss += loss[0]
         losses.append(total_loss)
 
@@ -137,13 +139,16 @@ for epoch in range(250):
                 p.update(p.value - RATE * (p.value.grad / float(BATCH)))
         if i % 10 == 0:
             correct = 0
-            y = jtorch.tensor(val_ys[:BATCH], (BATCH,))
-            x = jtorch.tensor(val_x[: (BATCH * 28 * 28)], (BATCH, 28 * 28))
-            out = model.forward(x.view(BATCH, 1, 28, 28)).view(BATCH)
+            y = jtorch.tensor(val_ys[:BATCH], (BATCH,), DTYPE)
+            x = jtorch.tensor(val_x[: (BATCH * 28 * 28)], (BATCH, 28 * 28), DTYPE)
+            # No graph is recorded for validation.
+            model.eval(no_grad=True)
+            out = model(x.view(BATCH, 1, 28, 28)).view(BATCH)
+            model.train()
             for i in range(BATCH):
-                if y[i] == 1 and out[i] > 0.5:
+                if y[i] == 1 and out[i] > 0.0:
                     correct += 1
-                if y[i] == 0 and out[i] < 0.5:
+                if y[i] == 0 and out[i] < 0.0:
                     correct += 1
             for channel in range(4):
                 vis.images(
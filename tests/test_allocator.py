@@ -0,0 +1,52 @@
+import gc
+import numpy as np
+from jtorch.allocator import CachingAllocator, size_class, ALIGNMENT
+
+
+def test_size_class():
+    assert size_class(4096) == 4096
+    assert size_class(4097) == 5120
+    assert size_class(8192) == 8192
+    for n in [4096, 5000, 12345, 10**6]:
+        assert n <= size_class(n) < 1.25 * n + ALIGNMENT
+
+
+def test_reuse():
+    alloc = CachingAllocator()
+    a = alloc.empty(1000)
+    assert a.shape == (1000,) and a.dtype == np.float64
+    assert a.ctypes.data % ALIGNMENT == 0
+    address = a.ctypes.data
+    del a
+    gc.collect()
+    assert alloc.stats()["bytes_cached"] == size_class(8000)
+
+    b = alloc.zeros(990)
+    assert b.ctypes.data == address and (b == 0.0).all()
+    assert alloc.hits == 1 and alloc.misses == 1
+    assert alloc.peak == alloc.bytes_in_use == size_class(8000)
+
+    # A view keeps the buffer out of the pool.
+    view = b.reshape(10, 99)[::2]
+    del b
+    gc.collect()
+    assert alloc.empty(1000).ctypes.data != address
+    del view
+    gc.collect()
+    assert alloc.empty(1000).ctypes.data == address
+
+    # Small buffers are aligned but not pooled.
+    c = alloc.empty(3, np.int32)
+    assert c.ctypes.data % ALIGNMENT == 0 and c.dtype == np.int32
+
+
+def test_limit():
+    alloc = CachingAllocator(limit=20000)
+    bufs = [alloc.empty(1000) for _ in range(4)]
+    del bufs
+    gc.collect()
+    assert alloc.bytes_cached == 2 * size_class(8000)
+    alloc.set_limit(10000)
+    assert alloc.bytes_cached == size_class(8000)
+    alloc.empty_cache()
+    assert alloc.bytes_cached == 0
@@ -1,5 +1,7 @@
+import threading
 import jtorch
 import pytest
+import numpy as np
 from jtorch import History, Variable
 
 
@@ -84,3 +86,112 @@ def test_backprop():
     var4 = Variable(History(Temp, None, [var2, var3]))
     var4.backward(5)
     assert var0.derivative == 10
+
+
+def test_backprop_reuse():
+    # Each variable is used twice by the next one: 2^40 paths to the leaf,
+    # but every backward runs once.
+    calls = []
+
+    class Count(Temp):
+        @staticmethod
+        def backward(ctx, d_output):
+            calls.append(1)
+            return d_output, d_output
+
+    var = Variable(History())
+    cur = var
+    for _ in range(40):
+        cur = Variable(History(Count, None, [cur, cur]))
+    order = jtorch.topological_sort(cur)
+    assert order[0] is cur and order[-1] is var and len(order) == 41
+
+    cur.backward(1)
+    assert var.derivative == 2**40
+    assert len(calls) == 40
+
+
+def test_no_grad():
+    x = jtorch.rand((2, 3))
+    x.requires_grad_(True)
+    with jtorch.no_grad():
+        assert not jtorch.is_grad_enabled()
+        y = (x * x).relu().sum()
+        with jtorch.no_grad():
+            pass
+        assert not jtorch.is_grad_enabled()
+    assert jtorch.is_grad_enabled()
+    assert y.history is None
+
+    @jtorch.inference_mode
+    def f(x):
+        return x * 2.0
+
+    @jtorch.inference_mode()
+    def g(x):
+        return x * 2.0
+
+    assert f(x).history is None and g(x).history is None
+    assert (x * 2.0).history is not None
+
+    # Raising inside restores recording.
+    with pytest.raises(ValueError):
+        with jtorch.no_grad():
+            raise ValueError
+    assert jtorch.is_grad_enabled()
+
+
+def test_no_grad_thread():
+    # A no_grad block in one thread leaves recording on in the others.
+    entered, done = threading.Event(), threading.Event()
+    seen = []
+
+    def worker():
+        with jtorch.no_grad():
+            entered.set()
+            done.wait(5)
+            seen.append(jtorch.is_grad_enabled())
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    entered.wait(5)
+    x = jtorch.rand((2, 3))
+    x.requires_grad_(True)
+    assert jtorch.is_grad_enabled()
+    assert (x * 2.0).history is not None
+    done.set()
+    thread.join()
+    assert seen == [False]
+
+
+def test_variable_ids():
+    a, b = Variable(None), Variable(None, name="b")
+    assert b.unique_id > a.unique_id
+    assert a.name == "var%d" % a.unique_id and b.name == "b"
+    assert hash(a) != hash(b)
+    with pytest.raises(AttributeError):
+        a.extra = 1
+
+
+def test_retain_graph():
+    import gc
+    import weakref
+
+    x = jtorch.rand((2, 3))
+    x.requires_grad_(True)
+    y = (x * 3.0).sigmoid()
+    saved = weakref.ref(y._tensor)
+    loss = (y * y).sum()
+    del y
+
+    loss.backward(retain_graph=True)
+    first = x.grad.to_numpy().copy()
+    loss.backward(retain_graph=True)
+    np.testing.assert_allclose(x.grad.to_numpy(), 2 * first)
+
+    # The default releases the saved activations as backward goes.
+    loss.backward()
+    gc.collect()
+    assert saved() is None
+    with pytest.raises(RuntimeError, match="retain_graph=True"):
+        loss.backward()
@@ -0,0 +1,72 @@
+import jtorch
+import pytest
+import numpy as np
+
+backend = jtorch.make_tensor_functions(jtorch.FastOps)
+
+
+class Layer(jtorch.Module):
+    def __init__(self):
+        super().__init__()
+        w = jtorch.rand((6, 6))
+        w.type_(backend)
+        self.weights = jtorch.Parameter(w - 0.5)
+
+    def forward(self, x):
+        return jtorch.dropout(jtorch.matmul(x, self.weights.value).relu(), 0.25)
+
+
+def run(layers, x, fn):
+    for layer in layers:
+        layer.weights.value.zero_grad_()
+    x.zero_grad_()
+    jtorch.manual_seed(3)
+    out = fn(layers, x)
+    out.sum().backward()
+    grads = [layer.weights.value.grad.to_numpy() for layer in layers]
+    return out.to_numpy(), grads + [x.grad.to_numpy()]
+
+
+def plain(layers, x):
+    for layer in layers:
+        x = layer(x)
+    return x
+
+
+@pytest.mark.parametrize(
+    "fn",
+    [
+        lambda layers, x: jtorch.checkpoint_sequential(layers, x),
+        lambda layers, x: jtorch.checkpoint_sequential(layers, x, segments=9),
+        lambda layers, x: plain([jtorch.Checkpointed(m) for m in layers], x),
+    ],
+)
+def test_checkpoint_matches(fn):
+    jtorch.manual_seed(0)
+    layers = [Layer() for _ in range(9)]
+    x = jtorch.rand((4, 6))
+    x.type_(backend)
+    x.requires_grad_(True)
+
+    # Same values and gradients, dropout masks included.
+    expected = run(layers, x, plain)
+    out, grads = run(layers, x, fn)
+    np.testing.assert_allclose(out, expected[0])
+    for g, e in zip(grads, expected[1]):
+        np.testing.assert_allclose(g, e)
+
+
+def test_checkpoint_function():
+    x = jtorch.rand((3, 4))
+    x.requires_grad_(True)
+    y = jtorch.rand((3, 4))
+    out = jtorch.checkpoint(lambda a, b: (a * b).sigmoid(), x, y)
+    # Nothing of the segment is recorded besides its inputs.
+    assert out.history.last_fn is jtorch.CheckpointFun
+    out.sum().backward()
+    s = (x * y).sigmoid().to_numpy()
+    np.testing.assert_allclose(x.grad.to_numpy(), s * (1 - s) * y.to_numpy())
+
+    # Without grad the function is just called.
+    with jtorch.no_grad():
+        assert jtorch.checkpoint(lambda a: a * 2.0, x).history is None
@@ -1,5 +1,6 @@
 import jtorch
 import pytest
+import numpy as np
 from hypothesis import given
 from .strategies import tensors, shaped_tensors, assert_close
 from .test_tensor import one_arg, two_arg, reduce
@@ -59,3 +60,98 @@ def test_two_grad_broadcast(fn, ts):
     # broadcast check
     jtorch.grad_check(fn[1], t1.sum(0), t2)
     jtorch.grad_check(fn[1], t1, t2.sum(0))
+
+
+@pytest.mark.task3_2
+def test_broadcast_patterns():
+    a = jtorch.rand((4, 5, 6))
+    a.type_(FastTensorFunctions)
+    row = jtorch.rand((6,))
+    row.type_(FastTensorFunctions)
+    col = jtorch.rand((4, 5, 1))
+    col.type_(FastTensorFunctions)
+    x = a.to_numpy()
+    checks = [
+        (a * 2.0, x * 2.0),
+        (a + row, x + row.to_numpy()),
+        (a * col, x * col.to_numpy()),
+        (a.permute(2, 0, 1) + 1.0, x.transpose(2, 0, 1) + 1.0),
+        (a.sum(2), x.sum(2, keepdims=True)),
+        (a.sum(0), x.sum(0, keepdims=True)),
+        (a.sum(1), x.sum(1, keepdims=True)),
+        (a.permute(2, 0, 1).sum(0), x.transpose(2, 0, 1).sum(0, keepdims=True)),
+        (a.sum(), x.sum().reshape(1)),
+    ]
+    for out, expected in checks:
+        assert out.shape == expected.shape
+        for ind in out._tensor.indices():
+            assert_close(out[ind], expected[ind])
+
+
+@pytest.mark.task3_2
+def test_odometer_strided():
+    # Large enough for every chunk to start mid-row, so the odometer is set
+    # up from arbitrary positions and wraps across several dimensions.
+    a = jtorch.rand((7, 9, 11))
+    a.type_(FastTensorFunctions)
+    b = jtorch.rand((11, 7, 9))
+    b.type_(FastTensorFunctions)
+    c = jtorch.rand((9, 7, 11))
+    c.type_(FastTensorFunctions)
+    x, y, z = a.to_numpy(), b.to_numpy(), c.to_numpy()
+    t = a.permute(2, 0, 1)
+    xt = x.transpose(2, 0, 1)
+    checks = [
+        (t.exp(), np.exp(xt)),
+        (t + b, xt + y),
+        # Both operands non-contiguous, with different stride patterns.
+        (t * c.permute(2, 1, 0), xt * z.transpose(2, 1, 0)),
+        (
+            a.permute(1, 2, 0) - b.permute(2, 0, 1),
+            x.transpose(1, 2, 0) - y.transpose(2, 0, 1),
+        ),
+        (t.sum(1), xt.sum(1, keepdims=True)),
+        (t.sum(2), xt.sum(2, keepdims=True)),
+    ]
+    for out, expected in checks:
+        assert out.shape == expected.shape
+        np.testing.assert_allclose(out.to_numpy(), expected)
+
+
+@pytest.mark.task3_2
+def test_odometer_broadcast():
+    col = jtorch.rand((7, 1, 11))
+    col.type_(FastTensorFunctions)
+    row = jtorch.rand((1, 9, 1))
+    row.type_(FastTensorFunctions)
+    scalar = jtorch.rand((1,))
+    scalar.type_(FastTensorFunctions)
+    c, r, s = col.to_numpy(), row.to_numpy(), scalar.to_numpy()
+    checks = [
+        # Both operands broadcast, on different dimensions.
+        (col + row, c + r),
+        (row * col, r * c),
+        # Broadcast operand that is also permuted.
+        (
+            col.permute(2, 1, 0) * row.permute(2, 1, 0),
+            c.transpose(2, 1, 0) * r.transpose(2, 1, 0),
+        ),
+        (col + scalar, c + s),
+        ((col + row).sum(1), (c + r).sum(1, keepdims=True)),
+    ]
+    for out, expected in checks:
+        assert out.shape == expected.shape
+        np.testing.assert_allclose(out.to_numpy(), expected)
+
+
+@pytest.mark.task3_2
+def test_odometer_empty():
+    assert jtorch.fast_ops.num_chunks(0) == 0
+    a = jtorch.zeros((0, 3), backend=FastTensorFunctions)
+    row = jtorch.rand((3,))
+    row.type_(FastTensorFunctions)
+    assert a.exp().shape == (0, 3)
+    assert (a + row).shape == (0, 3)
+    assert a.permute(1, 0).exp().shape == (3, 0)
+    assert a.sum(1).shape == (0, 1)
+    np.testing.assert_array_equal(a.sum(0).to_numpy(), np.zeros((1, 3)))
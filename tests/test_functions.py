@@ -1,5 +1,6 @@
 import jtorch
 import pytest
+import numpy as np
 from .strategies import assert_close
 
 
@@ -43,3 +44,78 @@ def test_broad_mm():
 #     print(c2)
 #     for ind in c._tensor.indices():
 #         assert_close(c[ind], c2[ind])
+
+
+@pytest.mark.task3_1
+def test_mm_layouts():
+    a = jtorch.rand((3, 70, 90))
+    b = jtorch.rand((3, 90, 65))
+    x, y = a.to_numpy(), b.to_numpy()
+    # Contiguous and transposed operands go to BLAS.
+    assert jtorch.blas_layout(a.shape, a._tensor.strides)
+    t = b.permute(0, 2, 1)
+    assert jtorch.blas_layout(t.shape, t._tensor.strides)
+    c = jtorch.matmul(a, t.permute(0, 2, 1))
+    np.testing.assert_allclose(c.to_numpy(), x @ y)
+
+    # With the batch dim innermost neither matrix dim is contiguous,
+    # which goes to the tiled kernel.
+    t = jtorch.rand((70, 80, 3)).permute(2, 0, 1)
+    assert not jtorch.blas_layout(t.shape, t._tensor.strides)
+
+    for layout in [(0, 1, 2), (1, 0, 2), (2, 0, 1), (2, 1, 0)]:
+        s = jtorch.rand((70, 80, 3)).permute(*layout)
+        r = jtorch.rand((s.shape[0], s.shape[2], 5))
+        expected = s.to_numpy() @ r.to_numpy()
+        np.testing.assert_allclose(jtorch.matmul(s, r).to_numpy(), expected)
+        np.testing.assert_allclose(
+            jtorch.functions._matrix_multiply(
+                *jtorch.zeros(expected.shape).tuple(), *s.tuple(), *r.tuple()
+            ).reshape(expected.shape),
+            expected,
+        )
+
+
+@pytest.mark.task3_1
+@pytest.mark.parametrize(
+    "a_shape, b_shape",
+    [
+        ((4, 3), (3, 5)),
+        ((2, 4, 3), (3, 5)),
+        ((4, 3), (2, 3, 5)),
+        ((2, 1, 4, 3), (3, 3, 5)),
+        ((3, 2, 4, 3), (1, 3, 5)),
+    ],
+)
+def test_mm_broadcast(a_shape, b_shape):
+    a = jtorch.rand(a_shape)
+    b = jtorch.rand(b_shape)
+    c = jtorch.matmul(a, b)
+    np.testing.assert_allclose(c.to_numpy(), a.to_numpy() @ b.to_numpy())
+    jtorch.grad_check(jtorch.matmul, a, b)
+
+    # Gradients are summed over the broadcast batch dims.
+    a.zero_grad_()
+    b.zero_grad_()
+    jtorch.matmul(a, b).sum().backward()
+    g = np.ones(c.shape)
+    expected_a = g @ np.swapaxes(b.to_numpy(), -1, -2)
+    expected_b = np.swapaxes(a.to_numpy(), -1, -2) @ g
+    for t, expected in [(a, expected_a), (b, expected_b)]:
+        while expected.ndim > t.dims:
+            expected = expected.sum(0)
+        axes = tuple(i for i, s in enumerate(t.shape) if s == 1)
+        expected = expected.sum(axes, keepdims=True)
+        np.testing.assert_allclose(t.grad.to_numpy(), expected)
+
+
+@pytest.mark.task3_1
+def test_mm_fold_batch():
+    a = jtorch.rand((2, 4, 3))
+    assert jtorch.fold_batch(a.shape, a._tensor.strides, (3, 5), (5, 1)) == (
+        (8, 3),
+        (3, 1),
+    )
+    t = a.permute(1, 0, 2)
+    assert jtorch.fold_batch(t.shape, t._tensor.strides, (3, 5), (5, 1)) is None
+    assert jtorch.fold_batch(a.shape, a._tensor.strides, (2, 3, 5), (15, 5, 1)) is None
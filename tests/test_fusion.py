@@ -0,0 +1,83 @@
+import jtorch
+import pytest
+import numpy as np
+from hypothesis import given
+from .strategies import tensors, shaped_tensors, assert_close
+from .test_tensor import one_arg, two_arg
+
+FusedTensorFunctions = jtorch.make_tensor_functions(jtorch.FastOps, fuse=True)
+
+
+@given(tensors(backend=FusedTensorFunctions))
+@pytest.mark.parametrize("fn", one_arg)
+def test_one_args(fn, t1):
+    t2 = fn[1](t1)
+    for ind in t2._tensor.indices():
+        assert_close(t2[ind], fn[1](jtorch.Scalar(t1[ind])).data)
+
+
+@given(shaped_tensors(2, backend=FusedTensorFunctions))
+@pytest.mark.parametrize("fn", two_arg)
+def test_two_grad_broadcast(fn, ts):
+    t1, t2 = ts
+    jtorch.grad_check(fn[1], t1, t2)
+    jtorch.grad_check(fn[1], t1.sum(0), t2)
+
+
+def test_chain_is_lazy():
+    x = jtorch.rand((4, 5))
+    x.type_(FusedTensorFunctions)
+    y = jtorch.rand((5,))
+    y.type_(FusedTensorFunctions)
+    out = (x * y) + (x - 1.0) * (y - 1.0)
+    assert isinstance(out._tensor, jtorch.LazyData)
+    assert out.shape == (4, 5)
+
+    expected = (x.to_numpy() * y.to_numpy()) + (x.to_numpy() - 1.0) * (
+        y.to_numpy() - 1.0
+    )
+    for ind in out._tensor.indices():
+        assert_close(out[ind], expected[ind])
+
+
+def test_kernel_cache():
+    x = jtorch.rand((3, 3))
+    x.type_(FusedTensorFunctions)
+    (x.sigmoid() * 2.0).sum()
+    n_kernels = len(jtorch.fusion._kernels)
+    z = jtorch.rand((7,))
+    z.type_(FusedTensorFunctions)
+    (z.sigmoid() * 2.0).sum()
+    assert len(jtorch.fusion._kernels) == n_kernels
+
+
+def test_sigmoid_backward():
+    x = jtorch.rand((2, 3))
+    x.type_(FusedTensorFunctions)
+    jtorch.grad_check(lambda a: (a * 4.0 - 2.0).sigmoid().log(), x)
+
+
+def test_write_after_build():
+    x = jtorch.rand((2, 3))
+    x.type_(FusedTensorFunctions)
+    old = x[0, 0]
+    y = x * 2.0
+    z = (x + 1.0).sigmoid() * 3.0
+    assert isinstance(y._tensor, jtorch.LazyData)
+
+    # Pending results are computed from the values before the write.
+    x[0, 0] = 100.0
+    assert_close(y[0, 0], 2 * old)
+    assert z[0, 0] < 3.0
+    x.uniform_()
+    assert_close((x * 2.0)[0, 0], 2 * x[0, 0])
+
+    # Also through another view of the same storage.
+    old = x[0, 1]
+    y = x * 2.0
+    x.permute(1, 0)[1, 0] = 100.0
+    assert_close(y[0, 1], 2 * old)
+    assert not jtorch.fusion.pending_reads
+
+    # Fused comparisons report a dtype, like eager ones.
+    assert (x < 0.5).dtype == np.dtype(bool)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+import jtorch
+from jtorch.mask import PackedMask, compare, pack, select, LT, EQ, GT, NE
+
+
+@pytest.mark.parametrize("op, ref", [(LT, np.less), (EQ, np.equal), (GT, np.greater)])
+def test_compare(op, ref):
+    a = jtorch.rand((3, 11, 5))
+    b = jtorch.rand((3, 1))
+    b[0, 0] = a[0, 0, 0]
+    # Strided operands, and a size that is not a multiple of 8.
+    mask = compare(a.permute(2, 0, 1), b, op)
+    expected = ref(a.to_numpy().transpose(2, 0, 1), b.to_numpy())
+    assert mask.shape == (5, 3, 11) and mask.nbytes == (5 * 3 * 11 + 7) // 8
+    np.testing.assert_array_equal(mask.to_numpy(), expected)
+    np.testing.assert_array_equal(PackedMask.from_numpy(expected).bits, mask.bits)
+
+    scalar = compare(a, 0.5, op)
+    np.testing.assert_array_equal(scalar.to_numpy(), ref(a.to_numpy(), 0.5))
+
+
+def test_select():
+    a = jtorch.rand((4, 9))
+    b = jtorch.rand((9,))
+    mask = compare(a, 0.5, GT)
+    keep = a.to_numpy() > 0.5
+    out = select(mask, a, b)
+    np.testing.assert_array_equal(
+        out.to_numpy(), np.where(keep, a.to_numpy(), b.to_numpy())
+    )
+    np.testing.assert_array_equal(
+        select(mask, a.permute(1, 0).permute(1, 0), 0.0).to_numpy(),
+        np.where(keep, a.to_numpy(), 0.0),
+    )
+    assert select(mask, 0.0, a).dtype == a.dtype
+
+    i = jtorch.tensor([0, 3, 0, 1], dtype=np.int64)
+    np.testing.assert_array_equal(pack(i).to_numpy(), [False, True, False, True])
+    np.testing.assert_array_equal(compare(i, 0, NE).bits, pack(i).bits)
+
+
+def test_int_tensor_float_scalar():
+    # Scalars follow the tensor promotion rules, 0.5 is not truncated to 0.
+    x = jtorch.tensor([0, 1, 2], dtype=np.int32)
+    np.testing.assert_array_equal(compare(x, 0.5, LT).to_numpy(), [True, False, False])
+    np.testing.assert_array_equal(compare(x, 0.5, LT).to_numpy(), (x < 0.5).to_numpy())
+    out = select(compare(x, 0, GT), x, 0.5)
+    assert out.dtype == np.float64
+    np.testing.assert_array_equal(out.to_numpy(), [0.5, 1.0, 2.0])
+    assert select(compare(x, 0, GT), x, 7).dtype == np.int32
@@ -85,3 +85,27 @@ def test_parameter():
     assert param.value == VAL_A
     param.update(VAL_B)
     assert param.value == VAL_B
+
+
+class Linear(jtorch.Module):
+    def __init__(self):
+        super().__init__()
+        self.weight = jtorch.Parameter(jtorch.rand((3, 2)))
+
+    def forward(self, x):
+        return (x.view(4, 3, 1) * self.weight.value.view(1, 3, 2)).sum(1)
+
+
+def test_eval_no_grad():
+    module = Linear()
+    x = jtorch.rand((4, 3))
+    assert module(x).history is not None
+
+    # Outputs of eval(no_grad=True) are constants, train() turns it off.
+    module.eval(no_grad=True)
+    assert module.no_grad and module(x).history is None
+    module.eval()
+    assert module(x).history is not None
+    module.eval(no_grad=True)
+    module.train()
+    assert not module.no_grad and module(x).history is not None
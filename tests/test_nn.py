@@ -2,6 +2,7 @@ import jtorch
 from hypothesis import given
 from .strategies import tensors, assert_close
 import pytest
+import numpy as np
 
 
 @pytest.mark.task4_2
@@ -72,6 +73,74 @@ def test_softmax(t):
     jtorch.grad_check(lambda a: jtorch.softmax(a, dim=2), t)
 
 
+@pytest.mark.task4_1
+@given(tensors(shape=(1, 1, 4, 4)))
+def test_log_softmax(t):
+    q = jtorch.softmax(t, 3)
+    q2 = jtorch.logsoftmax(t, 3).exp()
+    for i in q._tensor.indices():
+        assert_close(q[i], q2[i])
+
+    jtorch.grad_check(lambda a: jtorch.logsoftmax(a, dim=2), t)
+
+
+@pytest.mark.task4_1
+@pytest.mark.parametrize("dim", [0, 1, 2, -1])
+def test_softmax_stable(dim):
+    # Large logits and a permuted input, against NumPy.
+    t = (jtorch.rand((3, 4, 5)) * 2000.0).permute(2, 0, 1)
+    x = t.to_numpy()
+    shifted = x - x.max(dim, keepdims=True)
+    log_expected = shifted - np.log(np.exp(shifted).sum(dim, keepdims=True))
+    np.testing.assert_allclose(jtorch.logsoftmax(t, dim).to_numpy(), log_expected)
+    np.testing.assert_allclose(
+        jtorch.softmax(t, dim).to_numpy(), np.exp(log_expected), atol=1e-12
+    )
+    jtorch.grad_check(lambda a: jtorch.softmax(a * 0.001, dim), t)
+    jtorch.grad_check(lambda a: jtorch.logsoftmax(a * 0.001, dim), t)
+
+
+@pytest.mark.task4_1
+@pytest.mark.parametrize("reduction", ["none", "sum", "mean"])
+def test_bce_with_logits(reduction):
+    x = (jtorch.rand((4, 5)) - 0.5) * 100.0
+    y = jtorch.rand((5, 4)).permute(1, 0)
+    xn, yn = x.to_numpy(), y.to_numpy()
+    # -y log(sigmoid(x)) - (1 - y) log(1 - sigmoid(x)) in a stable form.
+    expected = np.logaddexp(0.0, xn) - xn * yn
+    if reduction != "none":
+        expected = np.array([getattr(expected, reduction)()])
+    out = jtorch.binary_cross_entropy_with_logits(x, y, reduction)
+    np.testing.assert_allclose(out.to_numpy(), expected, 1e-6, 1e-6)
+    jtorch.grad_check(
+        lambda a, b: jtorch.binary_cross_entropy_with_logits(a * 0.01, b, reduction),
+        x,
+        y,
+    )
+
+
+@pytest.mark.task4_1
+@pytest.mark.parametrize("dim, reduction", [(1, "mean"), (0, "sum"), (-1, "none")])
+def test_cross_entropy(dim, reduction):
+    x = jtorch.rand((4, 6)) * 50.0
+    xn = np.moveaxis(x.to_numpy(), dim, -1)
+    targets = np.arange(xn.shape[0]) % xn.shape[1]
+    shifted = xn - xn.max(-1, keepdims=True)
+    logp = shifted - np.log(np.exp(shifted).sum(-1, keepdims=True))
+    expected = -logp[np.arange(len(targets)), targets]
+    if reduction == "none":
+        expected = np.expand_dims(expected, dim)
+    else:
+        expected = np.array([getattr(expected, reduction)()])
+    out = jtorch.cross_entropy(x, jtorch.tensor(targets.tolist()), dim, reduction)
+    np.testing.assert_allclose(out.to_numpy(), expected)
+
+    # Matches logsoftmax picked at the targets, gradient included.
+    jtorch.grad_check(
+        lambda a: jtorch.cross_entropy(a * 0.01, targets, dim, reduction), x
+    )
+
+
 @pytest.mark.task4_3
 @given(tensors(shape=(1, 1, 6, 6)), tensors(shape=(1, 1, 2, 3)))
 def test_conv(input, weight):
@@ -103,3 +172,316 @@ def test_conv2():
     out.sum().backward()
 
     jtorch.grad_check(jtorch.Conv2dFun.apply, t, t2)
+
+
+def conv_reference(x, w, stride, pad, dilation):
+    "Direct NumPy convolution, `pad` is (top, bottom, left, right)."
+    kh, kw = w.shape[2:]
+    x = np.pad(x, ((0, 0), (0, 0), pad[:2], pad[2:]))
+    out_h = (x.shape[2] - dilation[0] * (kh - 1) - 1) // stride[0] + 1
+    out_w = (x.shape[3] - dilation[1] * (kw - 1) - 1) // stride[1] + 1
+    out = np.zeros((x.shape[0], w.shape[0], out_h, out_w))
+    for i in range(kh):
+        for j in range(kw):
+            patch = x[
+                :,
+                :,
+                i * dilation[0] : i * dilation[0]
+                + (out_h - 1) * stride[0]
+                + 1 : stride[0],
+                j * dilation[1] : j * dilation[1]
+                + (out_w - 1) * stride[1]
+                + 1 : stride[1],
+            ]
+            out += np.einsum("bchw,oc->bohw", patch, w[:, :, i, j])
+    return out
+
+
+@pytest.mark.task4_3
+@pytest.mark.parametrize(
+    "stride, padding, dilation",
+    [
+        (1, None, 1),
+        (1, 1, 1),
+        (2, 1, 1),
+        ((2, 1), (0, 2), 1),
+        (1, 2, 2),
+        (2, 0, (1, 2)),
+    ],
+)
+@pytest.mark.parametrize("algo", ["im2col", "fft"])
+def test_conv_geometry(stride, padding, dilation, algo):
+    input = jtorch.rand((2, 3, 7, 8))
+    weight = jtorch.rand((4, 3, 3, 2))
+    out = jtorch.conv2d(input, weight, stride, padding, dilation, algo)
+
+    s, d = jtorch.nn._pair(stride), jtorch.nn._pair(dilation)
+    if padding is None:
+        pad = (0, d[0] * 2, 0, d[1])
+    else:
+        p = jtorch.nn._pair(padding)
+        pad = (p[0], p[0], p[1], p[1])
+    expected = conv_reference(input.to_numpy(), weight.to_numpy(), s, pad, d)
+    np.testing.assert_allclose(out.to_numpy(), expected, 1e-6, 1e-6)
+    jtorch.grad_check(
+        lambda a, b: jtorch.conv2d(a, b, stride, padding, dilation, algo),
+        input,
+        weight,
+    )
+
+
+@pytest.mark.task4_3
+@pytest.mark.parametrize("padding", [None, 0, 1, 2, (1, 0)])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_conv_winograd(padding, dtype):
+    backend = jtorch.make_tensor_functions(jtorch.FastOps)
+    rng = np.random.default_rng(0)
+    input = jtorch.Tensor.make(
+        rng.random(252), (2, 3, 7, 6), backend=backend, dtype=dtype
+    )
+    weight = jtorch.Tensor.make(
+        rng.random(108), (4, 3, 3, 3), backend=backend, dtype=dtype
+    )
+    results = []
+    for algo in ["im2col", "winograd"]:
+        input.requires_grad_(True)
+        weight.requires_grad_(True)
+        input.zero_grad_()
+        weight.zero_grad_()
+        out = jtorch.conv2d(input, weight, padding=padding, algo=algo)
+        (out * out).sum().backward()
+        results.append([out, input.grad, weight.grad])
+    # The bound documented on `winograd_conv`.
+    rtol = jtorch.nn.WINOGRAD_RTOL[np.dtype(dtype)]
+    for a, b in zip(*results):
+        assert b.dtype == dtype
+        a = a.to_numpy()
+        np.testing.assert_allclose(b.to_numpy(), a, 0, rtol * np.abs(a).max())
+
+
+@pytest.mark.task4_3
+def test_winograd_filter_cache():
+    weight = jtorch.rand((2, 3, 3, 3))
+    u = jtorch.nn.winograd_filter(weight)
+    assert jtorch.nn.winograd_filter(weight) is u
+    assert jtorch.nn.winograd_filter(weight, flip=True).shape == (16, 3, 2)
+
+    weight[0, 0, 0, 0] = 5.0
+    assert jtorch.nn.winograd_filter(weight) is not u
+    x = jtorch.rand((1, 3, 5, 5))
+    np.testing.assert_allclose(
+        jtorch.conv2d(x, weight, algo="winograd").to_numpy(),
+        jtorch.conv2d(x, weight, algo="im2col").to_numpy(),
+        1e-10,
+        1e-10,
+    )
+
+
+@pytest.mark.task4_3
+def test_im2col_fold():
+    input = jtorch.rand((3, 2, 5, 4)).permute(0, 1, 3, 2)
+    geometry = (4, 5, (1, 1), (1, 1), (1, 1))
+    cols = jtorch.nn.im2col(input, (3, 3), *geometry).to_numpy()
+    folded = jtorch.nn.im2col(input, (3, 3), *geometry, fold=True)
+    np.testing.assert_array_equal(folded.to_numpy(), cols)
+    rows = jtorch.functions.flatten_rows(jtorch.functions.transpose(folded), 60)
+    assert rows._tensor._storage is folded._tensor._storage
+    np.testing.assert_array_equal(
+        rows.to_numpy(), cols.transpose(0, 2, 1).reshape(60, 18)
+    )
+
+
+@pytest.mark.task4_3
+def test_workspace_release(monkeypatch):
+    jtorch.nn.release_workspaces()
+    buf = jtorch.nn.workspace("test", 2048)
+    assert jtorch.nn.workspace("test", 1024).base is buf.base
+    assert jtorch.nn.workspace("test", 1024, np.float32).base is not buf.base
+
+    # Buffers over the cap are handed out fresh and not kept.
+    monkeypatch.setattr(jtorch.nn, "MAX_WORKSPACE_BYTES", 4096 * 8)
+    big = jtorch.nn.workspace("test", 8192)
+    assert jtorch.nn.workspace("test", 8192).base is not big.base
+    assert jtorch.nn.workspace("test", 1024).base is buf.base
+
+    # Released buffers go back to the allocator's pools.
+    cached = jtorch.default_allocator.bytes_cached
+    del buf, big
+    jtorch.nn.release_workspaces()
+    assert not jtorch.nn._workspace
+    assert jtorch.default_allocator.bytes_cached > cached
+
+
+@pytest.mark.task4_3
+def test_conv_fft_large_kernel():
+    input = jtorch.rand((4, 4, 24, 24))
+    weight = jtorch.rand((4, 4, 9, 9))
+    assert (
+        jtorch.nn.conv_algorithm(
+            "auto", input.shape, weight.shape, (24, 24, (1, 1), (4, 4), (1, 1))
+        )
+        == "fft"
+    )
+    results = []
+    for algo in ["im2col", "auto"]:
+        input.requires_grad_(True)
+        weight.requires_grad_(True)
+        input.zero_grad_()
+        weight.zero_grad_()
+        out = jtorch.conv2d(input, weight, padding=4, algo=algo)
+        (out * out).sum().backward()
+        results.append([out, input.grad, weight.grad])
+    for a, b in zip(*results):
+        np.testing.assert_allclose(a.to_numpy(), b.to_numpy(), 1e-9, 1e-9)
+
+    # The FFT path saves shapes and spectra, not the input and weight.
+    out = jtorch.conv2d(input, weight, padding=4, algo="fft")
+    saved = out.history.ctx.saved_values
+    assert saved[:3] == ("fft", input.shape, weight.shape)
+    with jtorch.no_grad():
+        out = jtorch.conv2d(input, weight, padding=4, algo="fft")
+    assert out.history is None
+
+
+@pytest.mark.task4_3
+@pytest.mark.parametrize("algo", ["im2col", "fft"])
+def test_conv1d(algo):
+    input = jtorch.rand((2, 3, 11))
+    weight = jtorch.rand((4, 3, 3))
+    out = jtorch.conv1d(input, weight, stride=2, padding=1, algo=algo)
+    x = np.pad(input.to_numpy(), ((0, 0), (0, 0), (1, 1)))
+    w = weight.to_numpy()
+    expected = np.stack(
+        [np.einsum("bck,ock->bo", x[:, :, i : i + 3], w) for i in range(0, 11, 2)], -1
+    )
+    np.testing.assert_allclose(out.to_numpy(), expected, 1e-9, 1e-9)
+    jtorch.grad_check(
+        lambda a, b: jtorch.conv1d(a, b, stride=2, padding=1, algo=algo), input, weight
+    )
+
+
+def pool_reference(x, kernel, stride, padding, reduce, fill):
+    x = np.pad(
+        x,
+        ((0, 0), (0, 0), (padding[0],) * 2, (padding[1],) * 2),
+        constant_values=fill,
+    )
+    out_h = (x.shape[2] - kernel[0]) // stride[0] + 1
+    out_w = (x.shape[3] - kernel[1]) // stride[1] + 1
+    out = np.zeros(x.shape[:2] + (out_h, out_w))
+    for y in range(out_h):
+        for z in range(out_w):
+            window = x[
+                :,
+                :,
+                y * stride[0] : y * stride[0] + kernel[0],
+                z * stride[1] : z * stride[1] + kernel[1],
+            ]
+            out[:, :, y, z] = reduce(window, axis=(2, 3))
+    return out
+
+
+@pytest.mark.task4_2
+@pytest.mark.parametrize(
+    "kernel, stride, padding",
+    [((2, 2), None, 0), ((3, 3), 2, 1), ((3, 2), (1, 2), (1, 0)), ((2, 3), 1, 0)],
+)
+def test_pool_geometry(kernel, stride, padding):
+    # A permuted input is read in place.
+    input = jtorch.rand((3, 2, 6, 7)).permute(1, 0, 2, 3)
+    s = kernel if stride is None else jtorch.nn._pair(stride)
+    p = jtorch.nn._pair(padding)
+    x = input.to_numpy()
+    out = jtorch.maxpool2d(input, kernel, stride, padding)
+    np.testing.assert_allclose(
+        out.to_numpy(), pool_reference(x, kernel, s, p, np.max, -np.inf)
+    )
+    out = jtorch.avgpool2d(input, kernel, stride, padding)
+    np.testing.assert_allclose(
+        out.to_numpy(), pool_reference(x, kernel, s, p, np.mean, 0.0)
+    )
+    for pool in [jtorch.maxpool2d, jtorch.avgpool2d]:
+        jtorch.grad_check(lambda t: pool(t, kernel, stride, padding), input)
+
+
+@pytest.mark.task4_2
+def test_maxpool_ties():
+    t = jtorch.tensor([1.0, 3.0, 3.0, 0.0], (1, 1, 2, 2))
+    t.requires_grad_(True)
+    jtorch.maxpool2d(t, (2, 2)).sum().backward()
+    np.testing.assert_allclose(t.grad.to_numpy().ravel(), [0.0, 1.0, 0.0, 0.0])
+
+
+@pytest.mark.task4_4
+def test_drop_seeded():
+    t = jtorch.rand((40, 50))
+    t.requires_grad_(True)
+    q = jtorch.dropout(t, 0.3, seed=7)
+    kept = q.to_numpy() != 0.0
+    np.testing.assert_allclose(q.to_numpy()[kept], t.to_numpy()[kept])
+    assert 0.25 < 1 - kept.mean() < 0.35
+
+    # Same seed, same mask, whatever the layout of the input.
+    q2 = jtorch.dropout(t.permute(1, 0).contiguous().permute(1, 0), 0.3, seed=7)
+    np.testing.assert_array_equal(q2.to_numpy() != 0.0, kept)
+    assert (jtorch.dropout(t, 0.3, seed=8).to_numpy() != 0.0).tolist() != kept.tolist()
+
+    # The backward pass regenerates the same mask.
+    q.sum().backward()
+    np.testing.assert_array_equal(t.grad.to_numpy(), kept.astype(float))
+
+
+@pytest.mark.task4_4
+def test_nn_float32():
+    backend = jtorch.make_tensor_functions(jtorch.FastOps)
+
+    def make(shape, dtype):
+        vals = np.random.default_rng(sum(shape)).random(int(np.prod(shape)))
+        t = jtorch.Tensor.make(vals, shape, backend=backend, dtype=dtype)
+        t.requires_grad_(True)
+        return t
+
+    results = {}
+    for dtype in [np.float32, np.float64]:
+        x = make((2, 3, 10, 10), dtype)
+        w = make((4, 3, 3, 3), dtype)
+        outs = [
+            jtorch.conv2d(x, w, algo="im2col"),
+            jtorch.conv2d(x, w, padding=1, algo="winograd"),
+            jtorch.conv2d(x, w, algo="fft"),
+            jtorch.maxpool2d(x, 2),
+            jtorch.avgpool2d(x, 2),
+            jtorch.logsoftmax(x, 1),
+            jtorch.dropout(x, 0.5, seed=1),
+        ]
+        for out in outs:
+            assert out.dtype == dtype
+        total = outs[0].sum()
+        for out in outs[1:]:
+            total = total + out.sum()
+        total.backward()
+        assert x.grad.dtype == dtype and w.grad.dtype == dtype
+        results[dtype] = [out.to_numpy() for out in outs] + [x.grad.to_numpy()]
+    for a, b in zip(results[np.float32], results[np.float64]):
+        np.testing.assert_allclose(a, b, rtol=1e-4, atol=1e-4)
+
+
+@pytest.mark.task4_4
+def test_where():
+    x = jtorch.rand((4, 6))
+    y = jtorch.rand((6,))
+    x.requires_grad_(True)
+    y.requires_grad_(True)
+    condition = x > 0.5
+    out = jtorch.where(condition, x, y)
+    keep = x.to_numpy() > 0.5
+    np.testing.assert_array_equal(
+        out.to_numpy(), np.where(keep, x.to_numpy(), y.to_numpy())
+    )
+    out.sum().backward()
+    np.testing.assert_array_equal(x.grad.to_numpy(), keep.astype(float))
+    np.testing.assert_array_equal(y.grad.to_numpy(), (~keep).sum(0))
+
+    packed = jtorch.mask.compare(x, 0.5, jtorch.mask.GT)
+    assert packed.nbytes == 3
+    np.testing.assert_array_equal(jtorch.where(packed, x, y).to_numpy(), out.to_numpy())
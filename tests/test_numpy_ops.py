@@ -0,0 +1,80 @@
+import jtorch
+import pytest
+from hypothesis import given
+from .strategies import tensors, shaped_tensors, assert_close
+from .test_tensor import one_arg, two_arg, reduce
+
+# TESTS are the same as test_tensor with different backend
+NumpyTensorFunctions = jtorch.make_tensor_functions(jtorch.NumpyOps)
+
+
+@given(tensors(backend=NumpyTensorFunctions))
+@pytest.mark.task3_2
+@pytest.mark.parametrize("fn", one_arg)
+def test_one_args(fn, t1):
+    t2 = fn[1](t1)
+    for ind in t2._tensor.indices():
+        assert_close(t2[ind], fn[1](jtorch.Scalar(t1[ind])).data)
+
+
+@given(shaped_tensors(2, backend=NumpyTensorFunctions))
+@pytest.mark.task3_2
+@pytest.mark.parametrize("fn", two_arg)
+def test_two_args(fn, ts):
+    t1, t2 = ts
+    t3 = fn[1](t1, t2)
+    for ind in t3._tensor.indices():
+        assert t3[ind] == fn[1](jtorch.Scalar(t1[ind]), jtorch.Scalar(t2[ind])).data
+
+
+@given(tensors(backend=NumpyTensorFunctions))
+@pytest.mark.task3_2
+@pytest.mark.parametrize("fn", one_arg)
+def test_one_derivative(fn, t1):
+    jtorch.grad_check(fn[1], t1)
+
+
+@given(tensors(backend=NumpyTensorFunctions))
+@pytest.mark.task3_2
+@pytest.mark.parametrize("fn", reduce)
+def test_reduce(fn, t1):
+    jtorch.grad_check(fn[1], t1)
+
+
+@given(shaped_tensors(2, backend=NumpyTensorFunctions))
+@pytest.mark.task3_2
+@pytest.mark.parametrize("fn", two_arg)
+def test_two_grad(fn, ts):
+    t1, t2 = ts
+    jtorch.grad_check(fn[1], t1, t2)
+
+
+@given(shaped_tensors(2, backend=NumpyTensorFunctions))
+@pytest.mark.task3_2
+@pytest.mark.parametrize("fn", two_arg)
+def test_two_grad_broadcast(fn, ts):
+    t1, t2 = ts
+    jtorch.grad_check(fn[1], t1, t2)
+
+    # broadcast check
+    jtorch.grad_check(fn[1], t1.sum(0), t2)
+    jtorch.grad_check(fn[1], t1, t2.sum(0))
+
+
+@given(tensors(backend=NumpyTensorFunctions, shape=(2, 3, 4)))
+def test_permuted_against_reference(t1):
+    ref = jtorch.Tensor(t1._tensor, backend=jtorch.TensorFunctions)
+    for order in [(2, 0, 1), (1, 2, 0)]:
+        out = (t1.permute(*order).exp() * t1.permute(*order)).sum(1)
+        expected = (ref.permute(*order).exp() * ref.permute(*order)).sum(1)
+        for ind in out._tensor.indices():
+            assert_close(out[ind], expected[ind])
+
+
+def test_large_reduce():
+    t = jtorch.rand((64, 32, 16))
+    t.type_(NumpyTensorFunctions)
+    out = t.sum(0).sum(2)
+    expected = t.to_numpy().sum(axis=(0, 2))
+    for i in range(32):
+        assert_close(out[0, i, 0], expected[i])
@@ -0,0 +1,50 @@
+import jtorch
+import pytest
+import numpy as np
+from jtorch import streaming
+
+backend = jtorch.make_tensor_functions(jtorch.FastOps)
+
+
+@pytest.fixture
+def mapped(tmp_path):
+    a = np.random.default_rng(0).random((50, 6, 4))
+    np.save(tmp_path / "a.npy", a)
+    return a, jtorch.from_file(tmp_path / "a.npy", backend=backend)
+
+
+def test_chunks(mapped):
+    a, t = mapped
+    # 6 * 4 float64 per row: 5 rows in 1000 bytes.
+    ranges = streaming.chunks(t, 1000)
+    assert ranges[0] == (0, 5) and ranges[-1] == (45, 50) and len(ranges) == 10
+    assert streaming.chunks(t, 1) == [(i, i + 1) for i in range(50)]
+
+
+@pytest.mark.parametrize("dim", [None, 0, 1, 2, -1, -3])
+def test_reduce(mapped, dim):
+    a, t = mapped
+    keep = dim is not None
+    for fn, ref in [
+        (streaming.sum, np.sum),
+        (streaming.mean, np.mean),
+        (streaming.max, np.max),
+    ]:
+        out = fn(t, dim, max_bytes=1000)
+        np.testing.assert_allclose(
+            out.to_numpy().ravel(), ref(a, dim, keepdims=keep).ravel()
+        )
+    # Non-contiguous inputs are copied chunk by chunk.
+    out = streaming.sum(t.permute(2, 0, 1), dim, max_bytes=100)
+    expected = a.transpose(2, 0, 1).sum(dim, keepdims=keep)
+    np.testing.assert_allclose(out.to_numpy().ravel(), expected.ravel())
+
+
+def test_map(mapped, tmp_path):
+    a, t = mapped
+    out = streaming.map(jtorch.operators.exp, t, tmp_path / "out.npy", max_bytes=500)
+    assert isinstance(out._tensor._storage, np.memmap)
+    np.testing.assert_allclose(np.load(tmp_path / "out.npy"), np.exp(a))
+
+    out = streaming.map(jtorch.operators.neg, t.permute(1, 0, 2), max_bytes=500)
+    np.testing.assert_allclose(out.to_numpy(), -a.transpose(1, 0, 2))
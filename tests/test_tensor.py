@@ -1,5 +1,6 @@
 import jtorch
 import pytest
+import numpy as np
 from hypothesis import given
 from hypothesis.strategies import floats, lists
 from .strategies import tensors, shaped_tensors, assert_close
@@ -98,3 +99,140 @@ def test_fromlist():
     t.shape == (2, 3)
     t = jtorch.tensor_fromlist([[[2, 3, 4], [4, 5, 7]]])
     t.shape == (1, 2, 3)
+
+
+def test_generator():
+    g = jtorch.Generator(5)
+    a = jtorch.rand((20, 30), generator=g)
+    assert a.shape == (20, 30)
+    assert 0.0 <= a.to_numpy().min() and a.to_numpy().max() < 1.0
+    b = jtorch.rand((20, 30), generator=jtorch.Generator(5))
+    np.testing.assert_array_equal(a.to_numpy(), b.to_numpy())
+
+    # Restoring the state replays the stream.
+    state = g.get_state()
+    c = jtorch.randn((1000,), generator=g)
+    g.set_state(state)
+    np.testing.assert_array_equal(
+        c.to_numpy(), jtorch.randn((1000,), generator=g).to_numpy()
+    )
+    assert abs(c.to_numpy().mean()) < 0.2 and abs(c.to_numpy().std() - 1) < 0.2
+
+    # Children of a stream are independent of each other.
+    x, y = g.spawn(2)
+    assert not np.array_equal(
+        jtorch.rand((10,), generator=x).to_numpy(),
+        jtorch.rand((10,), generator=y).to_numpy(),
+    )
+
+    jtorch.manual_seed(3)
+    d = jtorch.rand((4, 5))
+    jtorch.manual_seed(3)
+    np.testing.assert_array_equal(d.to_numpy(), jtorch.rand((4, 5)).to_numpy())
+
+    backend = jtorch.make_tensor_functions(jtorch.FastOps)
+    assert jtorch.rand((4, 5), backend=backend).tf is backend
+    assert jtorch.randn((4, 5), backend=backend).tf is backend
+
+    # Storage comes from the caching allocator.
+    in_use = jtorch.default_allocator.bytes_in_use
+    e = jtorch.rand((2000,), dtype=np.float32)
+    f = jtorch.randn((1000,))
+    assert jtorch.default_allocator.bytes_in_use >= in_use + 16000
+    assert e.dtype == np.float32 and f.dtype == np.float64
+
+
+def test_uniform_normal_():
+    t = jtorch.zeros((6, 8))
+    assert t.uniform_(-2.0, 3.0) is t
+    v = t.to_numpy()
+    assert -2.0 <= v.min() and v.max() < 3.0 and v.std() > 0.5
+
+    # Permuted views are filled through their strides.
+    t = jtorch.zeros((6, 8))
+    t.permute(1, 0).normal_(5.0, 0.1)
+    assert abs(t.to_numpy().mean() - 5.0) < 0.1
+
+
+def test_constructors():
+    z = jtorch.zeros((3, 4))
+    assert z.shape == (3, 4) and (z.to_numpy() == 0.0).all()
+    f = jtorch.full((2, 5), 1.5)
+    assert f.shape == (2, 5) and (f.to_numpy() == 1.5).all()
+    assert jtorch.empty((7, 2)).shape == (7, 2)
+
+    backend = jtorch.make_tensor_functions(jtorch.FastOps)
+    f.type_(backend)
+    like = jtorch.zeros_like(f)
+    assert like.shape == (2, 5) and like.tf is backend
+    assert (like.to_numpy() == 0.0).all()
+    assert f.empty().tf is backend
+
+
+@pytest.mark.parametrize("backend", [jtorch.FastOps, jtorch.NumpyOps, jtorch.TensorOps])
+def test_dtypes(backend):
+    tf = jtorch.make_tensor_functions(backend)
+    a = jtorch.rand((3, 4), dtype=np.float32)
+    a.type_(tf)
+    b = jtorch.rand((3, 4))
+    b.type_(tf)
+    i = jtorch.tensor([1, 2, 3, 4], dtype=np.int32)
+    i.type_(tf)
+
+    # Promotion on zip, scalars take the type of the tensor.
+    assert (a + b).dtype == np.float64
+    assert (a * 2.0).dtype == np.float32
+    assert (i + 1).dtype == np.int32 and (i + 1).to_numpy().tolist() == [2, 3, 4, 5]
+    assert (i * 0.5).dtype == np.float64
+    assert (a + i).dtype == np.float64
+
+    # Comparisons are bool, floating functions of integers are float64.
+    assert (a < 0.5).dtype == np.bool_ and (i == 2).dtype == np.bool_
+    np.testing.assert_array_equal((a < 0.5).to_numpy(), a.to_numpy() < 0.5)
+    assert ((a < 0.5) * a).dtype == np.float32
+    assert i.exp().dtype == np.float64 and a.exp().dtype == np.float32
+    assert (i < 3).sum().to_numpy().tolist() == [2.0]
+    assert a.sum(0).dtype == np.float32
+
+
+def test_dtype_grad():
+    a = jtorch.rand((3, 4), dtype=np.float32)
+    a.requires_grad_(True)
+    ((a * 3.0).sigmoid() * a).sum().backward()
+    assert a.grad.dtype == np.float32
+
+    b = jtorch.rand((3, 4), dtype=np.float32)
+    b.requires_grad_(True)
+    c = b.astype(np.float64)
+    assert c.dtype == np.float64
+    np.testing.assert_allclose(c.to_numpy(), b.to_numpy())
+    (c * c).sum().backward()
+    assert b.grad.dtype == np.float32
+    np.testing.assert_allclose(b.grad.to_numpy(), 2 * b.to_numpy(), rtol=1e-6)
+
+
+def test_from_file(tmp_path):
+    backend = jtorch.make_tensor_functions(jtorch.FastOps)
+    a = np.random.default_rng(0).random((3, 4))
+    np.save(tmp_path / "a.npy", a)
+
+    # The storage is the mapping, kernels and views read it in place.
+    t = jtorch.from_file(tmp_path / "a.npy", backend=backend)
+    assert isinstance(t._tensor._storage, np.memmap)
+    np.testing.assert_allclose((t * 2.0).sum(1).to_numpy().ravel(), 2 * a.sum(1))
+    np.testing.assert_allclose(t.permute(1, 0).to_numpy(), a.T)
+
+    np.save(tmp_path / "f.npy", np.asfortranarray(a))
+    f = jtorch.from_file(tmp_path / "f.npy")
+    assert f._tensor.strides == (1, 3)
+    np.testing.assert_allclose(f.to_numpy(), a)
+
+    # Writes through an "r+" or "w+" mapping land in the file.
+    w = jtorch.from_file(tmp_path / "w.npy", "w+", (2, 5), np.float32)
+    w.uniform_()
+    w.save(tmp_path / "copy.npy")
+    del w
+    np.testing.assert_array_equal(
+        np.load(tmp_path / "w.npy"), np.load(tmp_path / "copy.npy")
+    )
+    assert np.load(tmp_path / "w.npy").dtype == np.float32
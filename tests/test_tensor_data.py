@@ -116,3 +116,30 @@ def test_shape_broadcast():
 @given(tensor_data())
 def test_string(tensor_data):
     tensor_data.to_string()
+
+
+def test_coalesce_dims():
+    # Contiguous tensor plus a scalar is one flat dimension.
+    shape = (4, 5, 6)
+    strides = jtorch.strides_from_shape(shape)
+    scalar = jtorch.broadcast_strides(shape, (1,), (1,))
+    new_shape, (s1, s2), _ = jtorch.coalesce_dims(shape, [strides, scalar])
+    assert new_shape == (120,)
+    assert s1 == (1,) and s2 == (0,)
+
+    # Adding a row vector keeps the row/column split.
+    row = jtorch.broadcast_strides(shape, (6,), (1,))
+    new_shape, (s1, s2), _ = jtorch.coalesce_dims(shape, [strides, row])
+    assert new_shape == (20, 6)
+    assert s1 == (6, 1) and s2 == (0, 1)
+
+    # Size-1 dimensions disappear, transposed dims do not merge.
+    new_shape, (s1,), _ = jtorch.coalesce_dims((3, 1, 4), [(1, 12, 3)])
+    assert new_shape == (3, 4) and s1 == (1, 3)
+
+    # Reduced and kept dimensions never merge.
+    new_shape, (s1, s2), kinds = jtorch.reduce_dims(
+        (2, 3, 1), (3, 1, 1), (2, 3, 4), (12, 4, 1)
+    )
+    assert new_shape == (6, 4) and kinds == (0, 1)
+    assert s1 == (1, 0) and s2 == (4, 1)